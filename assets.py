@@ -0,0 +1,194 @@
+"""
+Fingerprinted and precompressed static assets.
+
+build() copies the stylesheets and scripts under the static folder to static/dist/
+with a content hash in their name (css/styles.css -> dist/css/styles.3f9a1c2b7e4d.css),
+writes gzip (and brotli, when the brotli package is installed) variants, removes the
+outputs of earlier builds and records the mapping in dist/manifest.json.
+url_for('static', ...) then emits the fingerprinted name and those files are served
+with an immutable Cache-Control, so browsers never revalidate them. Images keep
+their names, the derived ones are already versioned by images.py.
+
+"flask build-assets" runs at deploy time; workers only load the manifest unless
+ASSETS_BUILD_ON_STARTUP is set. The manifest digest is mixed into ETAG_SALT, so
+pages that link the previous build are no longer answered with a 304.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from collections import namedtuple
+
+import click
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional, gzip alone is fine
+    brotli = None
+
+EXTENSIONS = {".css", ".js"}
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _write_atomic(path: str, data: bytes):
+    """Writes through a temporary file so concurrently starting workers never see partial files."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+# Manifest served by one application, kept in app.extensions["assets"]; salt is its ETAG_SALT before the build
+AssetsState = namedtuple("AssetsState", "manifest salt")
+
+
+class Assets():
+    """Flask extension wiring the fingerprinted assets into url_for and the static route."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASSETS_DIST", "dist")
+        app.config.setdefault("ASSETS_BUILD_ON_STARTUP", False)
+        app.config.setdefault("ASSETS_MAX_AGE", 31536000)
+        app.extensions["assets"] = AssetsState(manifest={}, salt=app.config.get("ETAG_SALT", ""))
+
+        if app.config["ASSETS_BUILD_ON_STARTUP"]:
+            self.build(app)
+        else:
+            self.load_manifest(app)
+
+        app.url_defaults(self.fingerprint)
+        app.view_functions["static"] = self.send_static
+
+        @app.cli.command("build-assets")
+        def build_assets_command():
+            """Fingerprint and precompress the static assets."""
+            manifest, pruned = self.build(app)
+            click.echo(f"Built {len(manifest)} assets, removed {pruned} stale files")
+
+    @staticmethod
+    def dist_folder(app) -> str:
+        return os.path.join(app.static_folder, app.config["ASSETS_DIST"])
+
+    @staticmethod
+    def manifest_path(app) -> str:
+        return os.path.join(app.static_folder, app.config["ASSETS_DIST"], "manifest.json")
+
+    def load_manifest(self, app) -> dict:
+        try:
+            with open(self.manifest_path(app), encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = {}
+        self._use(app, manifest)
+        return manifest
+
+    @staticmethod
+    def _use(app, manifest: dict):
+        """Serves a manifest and salts the ETags with it, a new build changes the URLs in every page."""
+        salt = app.extensions["assets"].salt
+        app.extensions["assets"] = AssetsState(manifest=manifest, salt=salt)
+        digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        app.config["ETAG_SALT"] = f"{salt}|{digest}" if manifest else salt
+
+    def build(self, app) -> tuple:
+        """
+        Fingerprints the stylesheets and scripts of the static folder and removes stale outputs.
+        Returns: tuple: The manifest (original filename -> fingerprinted filename) and the number of removed files.
+        """
+        dist = app.config["ASSETS_DIST"]
+        # The build output and the generated image variants are never sources
+        skipped = {dist, app.config.get("IMAGES_DERIVED", "img/derived")}
+        manifest = {}
+        for root, directories, files in os.walk(app.static_folder):
+            relative_root = os.path.relpath(root, app.static_folder).replace(os.sep, "/")
+            if relative_root in skipped:
+                directories[:] = []
+                continue
+            for name in files:
+                stem, extension = os.path.splitext(name)
+                extension = extension.lower()
+                if extension not in EXTENSIONS:
+                    continue
+                with open(os.path.join(root, name), "rb") as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                source = os.path.normpath(os.path.join(relative_root, name)).replace(os.sep, "/")
+                target = "/".join(filter(None, (dist, os.path.dirname(source), f"{stem}.{digest}{extension}")))
+                manifest[source] = target
+                self._write_variants(os.path.join(app.static_folder, target), data)
+        _write_atomic(self.manifest_path(app), json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+        pruned = self._prune(app, manifest)
+        self._use(app, manifest)
+        return manifest, pruned
+
+    def _prune(self, app, manifest: dict) -> int:
+        """
+        Removes the files of the dist folder the manifest no longer names, with their compressed variants.
+        Returns: int: The number of files removed.
+        """
+        keep = {os.path.join(app.static_folder, target) for target in manifest.values()}
+        keep.add(self.manifest_path(app))
+        dist_folder = self.dist_folder(app)
+        removed = 0
+        for root, directories, files in os.walk(dist_folder, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                stem, suffix = os.path.splitext(path)
+                source = stem if suffix in (".br", ".gz") else path
+                if source not in keep:
+                    os.remove(path)
+                    removed += 1
+            if root != dist_folder and not os.listdir(root):
+                os.rmdir(root)
+        return removed
+
+    @staticmethod
+    def _write_variants(path: str, data: bytes):
+        """Content-addressed names never change, files that already exist are skipped."""
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        if not os.path.exists(path + ".gz"):
+            _write_atomic(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None and not os.path.exists(path + ".br"):
+            _write_atomic(path + ".br", brotli.compress(data))
+
+    @staticmethod
+    def fingerprint(endpoint: str, values: dict):
+        """url_defaults hook replacing static filenames by their fingerprinted names."""
+        if endpoint == "static":
+            filename = values.get("filename")
+            manifest = current_app.extensions["assets"].manifest
+            if filename in manifest:
+                values["filename"] = manifest[filename]
+
+    @staticmethod
+    def send_static(filename: str):
+        """Static route serving fingerprinted files precompressed and cached for good."""
+        app = current_app
+        if not filename.startswith(app.config["ASSETS_DIST"] + "/"):
+            return app.send_static_file(filename)
+
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and \
+                    os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = app.send_static_file(filename)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config["ASSETS_MAX_AGE"]
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+        return response
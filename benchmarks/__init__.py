@@ -0,0 +1,17 @@
+"""
+Load tests of the hot blog routes.
+
+    python -m benchmarks --db sqlite:////tmp/blog-bench.db --posts 2000 --comments 20000
+    python -m benchmarks --mode gunicorn --workers 4 --concurrency 16
+    python -m benchmarks --mode gunicorn --workers 2 --worker-class sync --worker-class gthread --db-latency 5
+
+The database given by --db is dropped and seeded with the requested volumes, then
+main_hub, view_category, view_post, login and comment posting are driven through
+the Flask test client (reporting SQL statements per request) and/or a multi-worker
+gunicorn server. Throughput and p50/p99 latency are reported per scenario; a fixed
+--seed makes the data and the request order reproducible between runs.
+
+Repeating --worker-class compares gunicorn worker classes on the same data;
+--db-latency delays every SQL statement to show how each class copes with a
+database that is a network hop away.
+"""
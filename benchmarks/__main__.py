@@ -0,0 +1,105 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import click
+
+from benchmarks.scenarios import SCENARIOS, ClientDriver, HttpDriver, run, format_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(url: str, process, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException("gunicorn exited during startup")
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException("gunicorn did not start in time")
+
+
+@click.command()
+@click.option("--db", "database_uri", default="sqlite:////tmp/blog-bench.db", show_default=True,
+              help="Disposable database, it is dropped and reseeded.")
+@click.option("--users", default=200, show_default=True)
+@click.option("--categories", default=10, show_default=True)
+@click.option("--posts", default=1000, show_default=True)
+@click.option("--comments", default=10000, show_default=True)
+@click.option("--requests", "requests_count", default=200, show_default=True, help="Measured requests per scenario.")
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(SCENARIOS), help="Defaults to all.")
+@click.option("--mode", type=click.Choice(("client", "gunicorn", "both")), default="client", show_default=True)
+@click.option("--workers", default=4, show_default=True, help="gunicorn worker processes.")
+@click.option("--worker-class", "worker_classes", multiple=True, default=("sync",), show_default=True,
+              help="Repeat to compare worker classes: sync, gthread or gevent.")
+@click.option("--threads", default=8, show_default=True, help="Threads per gthread worker.")
+@click.option("--db-latency", default=0.0, show_default=True,
+              help="Milliseconds added before every SQL statement in gunicorn mode, simulating a database server.")
+@click.option("--concurrency", default=8, show_default=True, help="Parallel HTTP clients in gunicorn mode.")
+@click.option("--page-cache/--no-page-cache", default=True, show_default=True)
+@click.option("--seed", "seed_value", default=0, show_default=True)
+def benchmark(database_uri, users, categories, posts, comments, requests_count, scenarios, mode, workers,
+              worker_classes, threads, db_latency, concurrency, page_cache, seed_value):
+    """Seed a database and load test the blog routes."""
+    # main reads its configuration from the environment on import, gunicorn workers inherit it
+    os.environ["DB_URI"] = database_uri
+    os.environ.setdefault("FLASK_KEY", "benchmark")
+    os.environ["PAGE_CACHE_ENABLED"] = "1" if page_cache else "0"
+    # The login and comment scenarios post far faster than any client is allowed to
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    sys.path.insert(0, ROOT)
+    from benchmarks.seed import seed
+
+    scenarios = scenarios or SCENARIOS
+    started = time.perf_counter()
+    data = seed(users, categories, posts, comments, seed_value)
+    click.echo(f"Seeded {users} users, {categories} categories, {posts} posts, {comments} comments "
+               f"in {time.perf_counter() - started:.1f}s")
+
+    if mode in ("client", "both"):
+        from main import app, db
+        driver = ClientDriver(app, db)
+        driver.login_user(data["emails"][0])
+        generator = random.Random(seed_value)
+        rows = [run(driver, scenario, data, requests_count, generator) for scenario in scenarios]
+        click.echo(format_report("\nFlask test client, 1 thread", rows))
+
+    if mode in ("gunicorn", "both"):
+        os.environ["BENCHMARK_DB_LATENCY_MS"] = str(db_latency)
+        for worker_class in worker_classes:
+            # A sync worker given more than one thread would silently become gthread
+            worker_threads = threads if worker_class == "gthread" else 1
+            port = _free_port()
+            process = subprocess.Popen([sys.executable, "-m", "gunicorn", "--config", "benchmarks/gunicorn_conf.py",
+                                        "--workers", str(workers), "--worker-class", worker_class,
+                                        "--threads", str(worker_threads), "--bind", f"127.0.0.1:{port}",
+                                        "--log-level", "warning", "main:app"], cwd=ROOT, env=os.environ.copy())
+            try:
+                _wait_until_ready(f"http://127.0.0.1:{port}/", process)
+                driver = HttpDriver(f"http://127.0.0.1:{port}", concurrency)
+                driver.login_user(data["emails"][0])
+                generator = random.Random(seed_value)
+                rows = [run(driver, scenario, data, requests_count, generator) for scenario in scenarios]
+                label = f"{worker_class} workers" + (f" x {worker_threads} threads" if worker_threads > 1 else "")
+                click.echo(format_report(f"\ngunicorn, {workers} {label}, {concurrency} concurrent clients"
+                                         + (f", {db_latency:g} ms per statement" if db_latency else ""), rows))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    benchmark()
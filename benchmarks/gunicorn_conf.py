@@ -0,0 +1,28 @@
+"""
+gunicorn settings of the benchmark server: the project's gunicorn.conf.py plus an
+optional delay before every SQL statement (BENCHMARK_DB_LATENCY_MS), standing in
+for the network round trip to a database server that a local SQLite file lacks.
+"""
+import os
+import runpy
+import time
+
+globals().update({name: value for name, value in
+                  runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                              "gunicorn.conf.py")).items()
+                  if not name.startswith("__")})
+
+
+_post_worker_init = post_worker_init
+
+
+def post_worker_init(worker):
+    _post_worker_init(worker)
+    latency = float(os.environ.get("BENCHMARK_DB_LATENCY_MS", 0)) / 1000
+    if latency:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        @event.listens_for(Engine, "before_cursor_execute")
+        def _wait(*args):
+            time.sleep(latency)
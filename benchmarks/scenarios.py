@@ -0,0 +1,183 @@
+"""
+Request drivers and the measurement loop of the benchmarks.
+"""
+import http.cookiejar
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from benchmarks.seed import PASSWORD
+
+SCENARIOS = ("main_hub", "view_category", "view_post", "login", "comment")
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def pick_path(scenario: str, data: dict, generator) -> str:
+    """Returns the URL a scenario requests, chosen at random from the seeded data."""
+    if scenario == "main_hub":
+        return "/"
+    if scenario == "view_category":
+        return f"/category/{generator.choice(data['categories'])}"
+    if scenario == "login":
+        return "/login"
+    category_id, post_id = generator.choice(data["posts"])
+    return f"/category/{category_id}/post/{post_id}"
+
+
+class ClientDriver():
+    """Runs requests in process through the Flask test client and counts their SQL statements."""
+
+    concurrency = 1
+
+    def __init__(self, app, db):
+        self.app = app
+        self.statements = 0
+        app.config["WTF_CSRF_ENABLED"] = False
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._count)
+        self.client = app.test_client()
+        self.user_client = None
+
+    def _count(self, *args):
+        self.statements += 1
+
+    def login_user(self, email: str):
+        """Logged in client used for posting comments."""
+        self.user_client = self.app.test_client()
+        self.user_client.post("/login", data={"email": email, "password": PASSWORD})
+
+    def request(self, scenario: str, path: str, email: str) -> tuple:
+        """
+        Performs one request.
+        Returns: tuple: (seconds, status code, number of SQL statements).
+        """
+        self.statements = 0
+        start = time.perf_counter()
+        if scenario == "login":
+            response = self.app.test_client().post(path, data={"email": email, "password": PASSWORD})
+        elif scenario == "comment":
+            response = self.user_client.post(path, data={"body": "Benchmark reply"})
+        else:
+            response = self.client.get(path)
+        return time.perf_counter() - start, response.status_code, self.statements
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver():
+    """Runs requests over HTTP against a running server, one cookie session per thread."""
+
+    def __init__(self, base_url: str, concurrency: int):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.email = None
+        self._local = threading.local()
+
+    @staticmethod
+    def _opener():
+        return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                           _NoRedirect())
+
+    def _open(self, opener, path: str, form: dict = None) -> tuple:
+        body = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with opener.open(self.base_url + path, data=body, timeout=60) as response:
+                return response.status, response.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as error:
+            return error.code, ""
+
+    def _token(self, opener, path: str) -> str:
+        match = CSRF_TOKEN.search(self._open(opener, path)[1])
+        return match.group(1) if match else ""
+
+    def _login(self, opener, email: str) -> int:
+        token = self._token(opener, "/login")
+        return self._open(opener, "/login", {"csrf_token": token, "email": email, "password": PASSWORD})[0]
+
+    def login_user(self, email: str):
+        self.email = email
+
+    def request(self, scenario: str, path: str, email: str) -> tuple:
+        session = self._local
+        if not hasattr(session, "opener"):
+            session.opener = self._opener()
+            session.user_opener = None
+            session.tokens = {}
+        if scenario == "login":
+            # Fresh session per login, fetching the form is not part of the measurement
+            opener = self._opener()
+            token = self._token(opener, path)
+            start = time.perf_counter()
+            status = self._open(opener, path, {"csrf_token": token, "email": email, "password": PASSWORD})[0]
+        elif scenario == "comment":
+            if session.user_opener is None:
+                session.user_opener = self._opener()
+                self._login(session.user_opener, self.email)
+            if path not in session.tokens:
+                session.tokens[path] = self._token(session.user_opener, path)
+            start = time.perf_counter()
+            status = self._open(session.user_opener, path, {"csrf_token": session.tokens[path],
+                                                            "body": "Benchmark reply"})[0]
+        else:
+            start = time.perf_counter()
+            status = self._open(session.opener, path)[0]
+        return time.perf_counter() - start, status, None
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def run(driver, scenario: str, data: dict, requests: int, generator, warmup: int = 5) -> dict:
+    """
+    Measures one scenario.
+    Args: driver: ClientDriver or HttpDriver.
+          scenario (str): One of SCENARIOS.
+          data (dict): Result of benchmarks.seed.seed().
+          requests (int): Number of measured requests.
+          generator (random.Random): Source of the request order.
+          warmup (int): Unmeasured requests sent first.
+    Returns: dict: Throughput, latency percentiles and SQL statements per request.
+    """
+    # Every client thread needs its session (and for comments its login) before measuring
+    warmup = max(warmup, 2 * driver.concurrency)
+    jobs = [(pick_path(scenario, data, generator), generator.choice(data["emails"]))
+            for _ in range(warmup + requests)]
+    with ThreadPoolExecutor(max_workers=driver.concurrency) as executor:
+        list(executor.map(lambda job: driver.request(scenario, *job), jobs[:warmup]))
+        start = time.perf_counter()
+        results = list(executor.map(lambda job: driver.request(scenario, *job), jobs[warmup:]))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(result[0] for result in results)
+    statements = [result[2] for result in results if result[2] is not None]
+    return {"scenario": scenario,
+            "requests": len(results),
+            "errors": sum(1 for result in results if result[1] >= 400),
+            "throughput": len(results) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "queries": sum(statements) / len(statements) if statements else None}
+
+
+def format_report(title: str, rows: list) -> str:
+    lines = [title,
+             f"{'scenario':<15}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}"]
+    for row in rows:
+        queries = f"{row['queries']:.1f}" if row["queries"] is not None else "-"
+        lines.append(f"{row['scenario']:<15}{row['requests']:>9}{row['errors']:>8}{row['throughput']:>10.1f}"
+                     f"{row['p50']:>10.1f}{row['p99']:>10.1f}{queries:>9}")
+    return "\n".join(lines)
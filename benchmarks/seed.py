@@ -0,0 +1,79 @@
+"""
+Synthetic data for the benchmarks.
+"""
+import datetime
+import random
+
+from sqlalchemy import insert
+
+PASSWORD = "Bench123"
+PARAGRAPH = ("<p>Lorem ipsum dolor sit amet, <strong>consectetur</strong> adipiscing elit, sed do eiusmod "
+             "tempor incididunt ut labore et dolore magna aliqua. <a href=\"https://example.com\">Ut enim</a> "
+             "ad minim veniam, quis nostrud exercitation ullamco laboris.</p>")
+
+
+def seed(users: int, categories: int, posts: int, comments: int, seed_value: int = 0) -> dict:
+    """
+    Recreates the schema of the configured database and fills it.
+    Args: users (int): Number of users, every one has the password PASSWORD.
+          categories (int): Number of categories.
+          posts (int): Number of posts, spread over the categories.
+          comments (int): Number of comments, spread over the posts.
+          seed_value (int): Seed of the random generator.
+    Returns: dict: Emails of the users and (category id, post id) pairs of the posts.
+    """
+    import main
+    import migrations
+    import search_index
+    from main import app, db, BlogCategory, BlogPost, Comment, User
+
+    generator = random.Random(seed_value)
+    start = datetime.datetime(2020, 1, 1)
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS post_search")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS comment_search")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS schema_migrations")
+        migrations.upgrade(db.engine)
+
+        # Hashing is deliberately slow, every user shares one hash of the same password
+        password = main.hash_password(PASSWORD)
+        emails = [f"user{index}@bench.local" for index in range(users)]
+        db.session.execute(insert(User), [
+            {"username": f"user{index}", "email": email, "password": password,
+             "email_hash": main.avatar_hash(email)} for index, email in enumerate(emails)])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+
+        db.session.execute(insert(BlogCategory), [
+            {"title": f"Category {index}", "subtitle": "Benchmark category", "img_url": "python-main-image.jpg",
+             "author_id": generator.choice(user_ids)} for index in range(categories)])
+        category_ids = db.session.scalars(db.select(BlogCategory.id)).all()
+
+        # Posts go through the ORM so the validator renders body_html and the excerpt
+        for index in range(posts):
+            db.session.add(BlogPost(title=f"Post {index}", subtitle="Benchmark post", img_url="coding-bg.jpg",
+                                    body=PARAGRAPH * generator.randint(2, 10),
+                                    date=start + datetime.timedelta(hours=index),
+                                    author_id=generator.choice(user_ids),
+                                    category_id=generator.choice(category_ids)))
+        db.session.flush()
+        post_ids = db.session.execute(db.select(BlogPost.category_id, BlogPost.id)).all()
+
+        batch = []
+        for index in range(comments):
+            batch.append({"text": f"Benchmark comment {index}", "author_id": generator.choice(user_ids),
+                          "parent_post_id": generator.choice(post_ids)[1],
+                          "posted_time": start + datetime.timedelta(minutes=index)})
+            if len(batch) == 1000:
+                db.session.execute(insert(Comment), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Comment), batch)
+        main.reconcile_counts()
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            search_index.rebuild(connection)
+
+    return {"emails": emails, "posts": [tuple(row) for row in post_ids], "categories": list(category_ids)}
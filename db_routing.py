@@ -0,0 +1,84 @@
+"""
+Connection pool settings and read replica routing.
+
+When SQLALCHEMY_BINDS contains a "replica" bind, views decorated with read_replica
+run their GET/HEAD queries against it; flushes, INSERT/UPDATE/DELETE statements and
+every other view use the primary. A request that commits stores the time in the
+user's session and that user reads from the primary for DB_REPLICA_LAG seconds, so
+a new comment is visible on the page the comment form redirects to.
+
+SQLite connections of the application's engines are opened with foreign key
+enforcement on (enable_sqlite_foreign_keys), which it leaves off by default, so the
+ON DELETE CASCADE constraints apply there as well.
+"""
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Update, event
+
+REPLICA_BIND = "replica"
+WRITE_MARKER = "_db_write_at"
+POOL_SETTINGS = (("DB_POOL_SIZE", "pool_size", int),
+                 ("DB_MAX_OVERFLOW", "max_overflow", int),
+                 ("DB_POOL_TIMEOUT", "pool_timeout", float),
+                 ("DB_POOL_RECYCLE", "pool_recycle", int),
+                 ("DB_POOL_PRE_PING", "pool_pre_ping", lambda value: value == "1"))
+
+
+def pool_options(environ) -> dict:
+    """
+    Engine pool options for SQLALCHEMY_ENGINE_OPTIONS, unset variables keep SQLAlchemy's defaults.
+    Args: environ (Mapping): Usually os.environ.
+    Returns: dict: Keyword arguments of create_engine().
+    """
+    return {option: convert(environ[name]) for name, option, convert in POOL_SETTINGS if environ.get(name)}
+
+
+def read_replica(function):
+    """Lets the GET/HEAD requests of a view read from the replica."""
+    @wraps(function)
+    def decorated_function(*args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            g.db_read_replica = True
+        return function(*args, **kwargs)
+    return decorated_function
+
+
+def use_replica() -> bool:
+    if not has_request_context() or not g.get("db_read_replica"):
+        return False
+    return time.time() - session.get(WRITE_MARKER, 0) > current_app.config.get("DB_REPLICA_LAG", 5)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session sending the reads of read_replica views to the replica bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, (Insert, Update, Delete))
+                and use_replica()):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                # Pages rendered from the replica may lag behind a write that already invalidated them
+                g.page_cache_max_ttl = current_app.config.get("DB_REPLICA_LAG", 5)
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(db_session):
+    if has_request_context() and REPLICA_BIND in current_app.config.get("SQLALCHEMY_BINDS", {}):
+        session[WRITE_MARKER] = time.time()
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def enable_sqlite_foreign_keys(engine):
+    """Turns foreign key enforcement on for every new connection of a SQLite engine, other engines are left alone."""
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "connect", _enable_foreign_keys):
+        event.listen(engine, "connect", _enable_foreign_keys)
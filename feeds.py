@@ -0,0 +1,87 @@
+"""
+RSS 2.0, Atom and JSON Feed documents.
+
+The writers are generators yielding the document piece by piece, so a feed can be
+streamed to the client while its entries are still being read from the database.
+"""
+import datetime
+import json
+from collections import namedtuple
+from email.utils import format_datetime
+from xml.sax.saxutils import escape, quoteattr
+
+# Maps the extension of the feed URL to the mimetype of the document
+FORMATS = {"xml": "application/rss+xml", "atom": "application/atom+xml", "json": "application/feed+json"}
+
+Feed = namedtuple("Feed", "title link feed_url description updated")
+Entry = namedtuple("Entry", "id title link summary content_html author published updated")
+
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    """The database stores naive UTC timestamps."""
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+
+def _rfc3339(value: datetime.datetime) -> str:
+    return _utc(value).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def rss(feed: Feed, entries):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" ' \
+          'xmlns:content="http://purl.org/rss/1.0/modules/content/"><channel>'
+    yield f"<title>{escape(feed.title)}</title><link>{escape(feed.link)}</link>"
+    yield f"<description>{escape(feed.description)}</description>"
+    yield f'<atom:link href={quoteattr(feed.feed_url)} rel="self" type="application/rss+xml"/>'
+    if feed.updated:
+        yield f"<lastBuildDate>{format_datetime(_utc(feed.updated))}</lastBuildDate>"
+    for entry in entries:
+        yield (f"<item><title>{escape(entry.title)}</title><link>{escape(entry.link)}</link>"
+               f'<guid isPermaLink="true">{escape(entry.link)}</guid>'
+               f"<pubDate>{format_datetime(_utc(entry.published))}</pubDate>"
+               f"<description>{escape(entry.summary)}</description>"
+               f"<content:encoded>{escape(entry.content_html)}</content:encoded></item>")
+    yield "</channel></rss>\n"
+
+
+def atom(feed: Feed, entries):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom">'
+    yield f"<id>{escape(feed.link)}</id><title>{escape(feed.title)}</title>"
+    yield f"<subtitle>{escape(feed.description)}</subtitle>"
+    yield f"<link href={quoteattr(feed.link)}/><link href={quoteattr(feed.feed_url)} rel=\"self\"/>"
+    yield f"<updated>{_rfc3339(feed.updated or datetime.datetime(1970, 1, 1))}</updated>"
+    for entry in entries:
+        yield (f"<entry><id>{escape(entry.link)}</id><title>{escape(entry.title)}</title>"
+               f"<link href={quoteattr(entry.link)}/>"
+               f"<published>{_rfc3339(entry.published)}</published><updated>{_rfc3339(entry.updated)}</updated>"
+               f"<author><name>{escape(entry.author)}</name></author>"
+               f"<summary>{escape(entry.summary)}</summary>"
+               f'<content type="html">{escape(entry.content_html)}</content></entry>')
+    yield "</feed>\n"
+
+
+def json_feed(feed: Feed, entries):
+    header = {"version": "https://jsonfeed.org/version/1.1", "title": feed.title, "home_page_url": feed.link,
+              "feed_url": feed.feed_url, "description": feed.description}
+    # The items array is written one entry at a time after the header fields
+    yield json.dumps(header)[:-1] + ', "items": ['
+    for index, entry in enumerate(entries):
+        item = {"id": entry.link, "url": entry.link, "title": entry.title, "summary": entry.summary,
+                "content_html": entry.content_html, "date_published": _rfc3339(entry.published),
+                "date_modified": _rfc3339(entry.updated), "authors": [{"name": entry.author}]}
+        yield ("," if index else "") + json.dumps(item)
+    yield "]}\n"
+
+
+WRITERS = {"xml": rss, "atom": atom, "json": json_feed}
+
+
+def generate(kind: str, feed: Feed, entries):
+    """
+    Yields the document of a feed.
+    Args: kind (str): Key of FORMATS.
+          feed (Feed): Channel metadata.
+          entries (iterable): Entry tuples, newest first. Consumed lazily.
+    """
+    return WRITERS[kind](feed, entries)
@@ -17,6 +17,8 @@
 """Small extension for Flask to make using Gravatar easy."""
 
 import hashlib
+import threading
+from collections import OrderedDict
 
 from flask import current_app, has_request_context, request
 
@@ -34,6 +36,13 @@ connection_stack = _app_ctx_stack
 has_context = has_app_context or has_request_context
 
 
+def gravatar_hash(email, force_lower=False):
+    """Return the MD5 hex digest Gravatar uses to identify an email."""
+    if force_lower:
+        email = email.lower()
+    return hashlib.md5(email.encode('utf-8')).hexdigest()
+
+
 class Property(object):
     """A property descriptor that sets and returns values."""
 
@@ -64,8 +73,13 @@ class Gravatar(object):
                             force_default=False,
                             force_lower=False,
                             use_ssl=False,
-                            base_url=None
+                            base_url=None,
+                            cache_size=1024
                            )
+
+    Generated links are memoized in a bounded LRU cache keyed on the email
+    (or its hash), the resolved options and the URL scheme. Use
+    :meth:`bulk` to build the links of many emails with one option lookup.
     """
 
     size = Property(100, key='GRAVATAR_SIZE')
@@ -87,7 +101,15 @@ class Gravatar(object):
         :param force_lower: Make email.lower() before build link
         :param use_ssl: Use https rather than http
         :param base_url: Use custom base url for build link
+        :param cache_size: Number of generated links kept in memory
         """
+        self.cache_size = kwargs.pop('cache_size', 1024)
+        self._links = OrderedDict()
+        self._options = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
         for key in tuple(kwargs.keys()):
             if hasattr(self, key):
                 setattr(self, key, kwargs.pop(key))
@@ -108,38 +130,97 @@ class Gravatar(object):
         app.jinja_env.filters.setdefault('gravatar', self)
         app.extensions['gravatar'] = self
 
-    def __call__(self, email, size=None, rating=None, default=None,
-                 force_default=None, force_lower=False, use_ssl=None,
-                 base_url=None):
-        """Build gravatar link."""
-        if size is None:
-            size = self.size
-
-        if rating is None:
-            rating = self.rating
-
-        if default is None:
-            default = self.default
-
-        if force_default is None:
-            force_default = self.force_default
-
-        if force_lower is None:
-            force_lower = self.force_lower
-
-        if force_lower:
-            email = email.lower()
+    def _defaults(self):
+        """Resolve the configured options once per application."""
+        app_key = id(current_app._get_current_object()) if has_context() else None
+        defaults = self._options.get(app_key)
+        if defaults is None:
+            defaults = (self.size, self.rating, self.default,
+                        self.force_default, self.force_lower,
+                        self.use_ssl, self.base_url)
+            self._options[app_key] = defaults
+        return defaults
+
+    def _resolve(self, size, rating, default, force_default, force_lower,
+                 use_ssl, base_url):
+        """Fill unset options from the configuration and detect the scheme."""
+        (d_size, d_rating, d_default, d_force_default, d_force_lower,
+         d_use_ssl, d_base_url) = self._defaults()
 
         if use_ssl is None:
-            use_ssl = self.use_ssl
+            use_ssl = d_use_ssl
 
         if use_ssl is None and has_request_context():
             use_ssl = request.headers.get('X-Forwarded-Proto',
                                           request.scheme) == 'https'
 
-        if base_url is None:
-            base_url = self.base_url
+        return (d_size if size is None else size,
+                d_rating if rating is None else rating,
+                d_default if default is None else default,
+                d_force_default if force_default is None else force_default,
+                d_force_lower if force_lower is None else force_lower,
+                bool(use_ssl),
+                d_base_url if base_url is None else base_url)
+
+    def _link(self, value, hashed, options):
+        """Return the memoized link for an email or a precomputed hash."""
+        key = (value, hashed) + options
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                self._links.move_to_end(key)
+                self.hits += 1
+                return link
+            self.misses += 1
+
+        size, rating, default, force_default, force_lower, use_ssl, \
+            base_url = options
+        hash = value if hashed else gravatar_hash(value, force_lower)
+        link = self._build(hash, size, rating, default, force_default,
+                           use_ssl, base_url)
+
+        with self._lock:
+            self._links[key] = link
+            while len(self._links) > self.cache_size:
+                self._links.popitem(last=False)
+        return link
+
+    def __call__(self, email, size=None, rating=None, default=None,
+                 force_default=None, force_lower=None, use_ssl=None,
+                 base_url=None, email_hash=None):
+        """Build gravatar link.
 
+        :param email_hash: Precomputed :func:`gravatar_hash` of the email,
+            skips hashing when given
+        """
+        options = self._resolve(size, rating, default, force_default,
+                                force_lower, use_ssl, base_url)
+        if email_hash is not None:
+            return self._link(email_hash, True, options)
+        return self._link(email, False, options)
+
+    def bulk(self, values, hashed=False, size=None, rating=None, default=None,
+             force_default=None, force_lower=None, use_ssl=None,
+             base_url=None):
+        """Build gravatar links for many emails at once.
+
+        :param values: Iterable of emails, or of hashes when ``hashed``
+        :param hashed: The values are precomputed :func:`gravatar_hash` digests
+        :returns: List of links in the order of ``values``
+        """
+        options = self._resolve(size, rating, default, force_default,
+                                force_lower, use_ssl, base_url)
+        return [self._link(value, hashed, options) for value in values]
+
+    def clear_cache(self):
+        """Forget memoized links and resolved options."""
+        with self._lock:
+            self._links.clear()
+            self._options.clear()
+
+    @staticmethod
+    def _build(hash, size, rating, default, force_default, use_ssl,
+               base_url):
         if base_url is not None:
             url = base_url + 'avatar/'
         else:
@@ -148,8 +229,6 @@ class Gravatar(object):
             else:
                 url = 'http://www.gravatar.com/avatar/'
 
-        hash = hashlib.md5(email.encode('utf-8')).hexdigest()
-
         link = '{url}{hash}'\
                '?s={size}&d={default}&r={rating}'.format(**locals())
 
@@ -158,4 +237,4 @@ class Gravatar(object):
 
         return link
 
-__all__ = ('Gravatar', '__version__')
+__all__ = ('Gravatar', 'gravatar_hash', '__version__')
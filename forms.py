@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField
+from wtforms import StringField, SubmitField, PasswordField, DateField
 from wtforms.validators import DataRequired, URL
 from wtforms import validators
 from flask_ckeditor import CKEditorField
@@ -42,15 +42,16 @@ class LoginForm(FlaskForm):
     def __init__(self, db, User, *args, **kwargs):
         self.db = db
         self.User = User
+        self.user = None # Looked up once in validate_email, reused by validate_password and the login route
         super().__init__(*args, **kwargs)
 
     def validate_email(self, field):
-        if self.db.session.execute(self.db.select(self.User).where(self.User.email == field.data)).scalar() == None:
+        self.user = self.db.session.execute(self.db.select(self.User).where(self.User.email == field.data)).scalar()
+        if self.user == None:
             raise validators.ValidationError('This email does not exist.')
 
     def validate_password(self, field):
-        user = self.db.session.execute(self.db.select(self.User).where(self.User.email == self.email.data)).scalar()
-        if user and not check_password_hash(user.password, field.data):
+        if self.user and not check_password_hash(self.user.password, field.data):
             raise validators.ValidationError('Incorrect password')
 
     email = StringField("Enter you email", validators=[DataRequired()])
@@ -62,7 +63,7 @@ class CreatePostForm(FlaskForm):
     title = StringField("Blog Post Title", validators=[DataRequired()])
     subtitle = StringField("Subtitle", validators=[DataRequired()])
     img_url = StringField("Blog Image Path", validators=[DataRequired()])
-    date = StringField("Blog Upload Data", validators=[DataRequired()])
+    date = DateField("Blog Upload Date", validators=[DataRequired()])
     body = CKEditorField("Blog Content", validators=[DataRequired()])
     submit = SubmitField("Submit Post")
 
@@ -0,0 +1,84 @@
+"""
+gunicorn settings, picked up by "gunicorn main:app" from the project directory.
+
+The default worker class is gthread: every worker process serves GUNICORN_THREADS
+requests at once, so a request waiting on the database or a slow client no longer
+blocks the whole worker. The views are I/O bound and psycopg2 and sqlite3 release
+the GIL while they wait, so threads give most of the concurrency of an async
+server without rewriting the views or the models.
+
+GUNICORN_WORKER_CLASS=gevent runs each request in a greenlet instead. psycopg2
+only yields to other greenlets once psycogreen patches it, post_fork() does that.
+
+Workers only share what lives outside their memory. With more than one worker
+the rate limiter defaults to a SQLite file in the instance folder
+(RATE_LIMIT_URL), the cache tag versions already live in one (CACHE_TAGS_URL),
+and the server refuses to start when either is explicitly set to "memory". The
+page cache may stay in each worker's memory: its entries carry the shared tag
+versions, so an invalidation in one worker retires them in every worker.
+
+Every worker starts the contact form mailer in post_worker_init().
+
+Command line options override these settings, e.g. "gunicorn -k sync main:app".
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+# Workers are recycled now and then so slow memory growth never accumulates
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+# The application is built in every worker, main:app creates it on first access
+preload_app = False
+
+INSTANCE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+# Stores every worker has to share: setting, the flag disabling it, default file in the instance folder
+SHARED_STORES = (("RATE_LIMIT_URL", "RATE_LIMIT_ENABLED", "rate-limit.db"),
+                 ("CACHE_TAGS_URL", None, None))
+
+
+def share_stores(server):
+    """Points the caches and rate limits of several workers at SQLite files, the workers inherit the environment."""
+    if server.cfg.workers <= 1:
+        return
+    for name, flag, filename in SHARED_STORES:
+        if flag and os.environ.get(flag, "1") != "1":
+            continue
+        url = os.environ.get(name)
+        if url == "memory":
+            raise RuntimeError(f"{name}=memory is not shared between the {server.cfg.workers} workers, "
+                               f"set a sqlite:/// URL or GUNICORN_WORKERS=1")
+        if not url and filename:
+            os.makedirs(INSTANCE_FOLDER, exist_ok=True)
+            os.environ[name] = "sqlite:///" + os.path.join(INSTANCE_FOLDER, filename)
+
+
+def post_fork(server, worker):
+    if worker.__class__.__name__.startswith("Gevent"):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Every worker delivers the outbox, including the messages queued before a restart
+    from web_email import mailer
+    mailer.start()
+
+
+def on_starting(server):
+    share_stores(server)
+    # Every thread or greenlet of a worker may hold a connection, the pool has to cover them
+    if os.environ.get("DB_POOL_SIZE") or server.cfg.worker_class_str == "sync":
+        return
+    if server.cfg.worker_class_str == "gthread":
+        concurrency = server.cfg.threads
+    else:
+        # Greenlets beyond the pool wait for a connection for up to DB_POOL_TIMEOUT seconds
+        concurrency = min(server.cfg.worker_connections, 20)
+    os.environ["DB_POOL_SIZE"] = str(concurrency)
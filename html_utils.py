@@ -0,0 +1,189 @@
+"""Helpers for the HTML produced by the CKEditor fields."""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+BLOCK_TAGS = {"p", "div", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+              "blockquote", "pre", "table", "tr", "td", "th", "hr", "figure", "figcaption"}
+SKIPPED_TAGS = {"script", "style", "template", "noscript"}
+
+
+class TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML fragment."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Strips tags from an HTML fragment.
+    Args: html (str): HTML source, e.g. BlogPost.body.
+    Returns: str: The visible text with whitespace collapsed.
+    """
+    extractor = TextExtractor()
+    extractor.feed(html or "")
+    extractor.close()
+    return " ".join("".join(extractor.parts).split())
+
+
+# Markup kept when sanitizing post bodies, everything else is dropped (tags) or stripped (attributes)
+ALLOWED_TAGS = {"a", "abbr", "b", "blockquote", "br", "caption", "code", "div", "em", "figcaption", "figure",
+                "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre", "s", "small",
+                "span", "strong", "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul"}
+# class and style are allowed on every tag, styles are filtered by sanitize_style()
+GLOBAL_ATTRIBUTES = {"class", "style"}
+ALLOWED_ATTRIBUTES = {"a": {"href", "title", "target", "rel"},
+                      "img": {"src", "alt", "title", "width", "height"},
+                      "td": {"colspan", "rowspan"},
+                      "th": {"colspan", "rowspan", "scope"}}
+# CSS the editor writes for alignment, sizes, colors and fonts
+ALLOWED_CSS_PROPERTIES = {"background-color", "border", "border-collapse", "border-color", "border-style",
+                          "border-width", "color", "float", "font-family", "font-size", "font-style",
+                          "font-weight", "height", "line-height", "list-style-type", "margin", "margin-bottom",
+                          "margin-left", "margin-right", "margin-top", "max-width", "padding", "padding-bottom",
+                          "padding-left", "padding-right", "padding-top", "text-align", "text-decoration",
+                          "vertical-align", "width"}
+# Keywords, lengths, colors and quoted font names; color functions are the only parentheses allowed
+CSS_VALUE = re.compile(r"""(?:[\w\s#.,%+\-'"]|(?:rgba?|hsla?)\([\d\s.,%/]*\))*""", re.IGNORECASE)
+# Comments keep inline formatting only: no links, images, classes or styles
+COMMENT_TAGS = {"b", "br", "code", "em", "i"}
+URL_ATTRIBUTES = {"href", "src"}
+SAFE_SCHEMES = ("http:", "https:", "mailto:")
+VOID_TAGS = {"br", "hr", "img"}
+WHITESPACE = re.compile(r"\s+")
+
+
+def is_safe_url(url: str) -> bool:
+    url = "".join(url.split()).lower()
+    return ":" not in url.split("/", 1)[0] or url.startswith(SAFE_SCHEMES)
+
+
+def sanitize_style(style: str) -> str:
+    """
+    Keeps the declarations of an inline style whose property is allowed and whose value is plain.
+    Args: style (str): Value of a style attribute.
+    Returns: str: The allowed declarations, empty when none is left.
+    """
+    declarations = []
+    for declaration in style.split(";"):
+        name, _, value = declaration.partition(":")
+        name, value = name.strip().lower(), value.strip()
+        if name in ALLOWED_CSS_PROPERTIES and value and CSS_VALUE.fullmatch(value):
+            declarations.append(f"{name}: {value}")
+    return "; ".join(declarations)
+
+
+class Sanitizer(HTMLParser):
+    """Re-serializes HTML keeping only allowed tags and attributes, with whitespace collapsed."""
+
+    tags = ALLOWED_TAGS
+    attributes = ALLOWED_ATTRIBUTES
+    global_attributes = GLOBAL_ATTRIBUTES
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+        self.preformatted = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+            return
+        if self.skipping or tag not in self.tags:
+            return
+        allowed = self.attributes.get(tag, set()) | self.global_attributes
+        rendered = ""
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not is_safe_url(value):
+                continue
+            if name == "style":
+                value = sanitize_style(value)
+                if not value:
+                    continue
+            rendered += f' {name}="{escape(value, quote=True)}"'
+        self.parts.append(f"<{tag}{rendered}>")
+        if tag == "pre":
+            self.preformatted += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+            return
+        if self.skipping or tag not in self.tags or tag in VOID_TAGS:
+            return
+        if tag == "pre":
+            self.preformatted = max(self.preformatted - 1, 0)
+        self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if not self.preformatted:
+            data = WHITESPACE.sub(" ", data)
+        self.parts.append(escape(data, quote=False))
+
+
+class CommentSanitizer(Sanitizer):
+    """Sanitizer of visitor comments, keeping COMMENT_TAGS without any attribute."""
+
+    tags = COMMENT_TAGS
+    attributes = {}
+    global_attributes = set()
+
+
+def _sanitize(sanitizer: Sanitizer, html: str) -> str:
+    sanitizer.feed(html or "")
+    sanitizer.close()
+    return "".join(sanitizer.parts).strip()
+
+
+def sanitize_html(html: str) -> str:
+    """
+    Sanitizes and minifies CKEditor output for rendering with |safe.
+    Args: html (str): HTML source as stored in BlogPost.body.
+    Returns: str: HTML with disallowed tags, attributes and URLs removed.
+    """
+    return _sanitize(Sanitizer(), html)
+
+
+def sanitize_comment(text: str) -> str:
+    """
+    Sanitizes a comment for rendering with |safe, everything but bold, italic, code and line breaks is text.
+    Args: text (str): Comment as submitted, CommentForm.body.
+    Returns: str: Escaped text with the allowed inline tags.
+    """
+    return _sanitize(CommentSanitizer(), text)
+
+
+def make_excerpt(text: str, length: int = 200) -> str:
+    """Shortens plain text to at most `length` characters, cutting at a word boundary."""
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0].rstrip(",.;:-") + "…"
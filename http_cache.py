@@ -0,0 +1,74 @@
+"""
+HTTP conditional requests for rendered pages.
+
+A view decorated with @conditional(validator) first asks the validator for the
+version of the rows behind the page. When the browser already holds that version
+(If-None-Match / If-Modified-Since) a 304 is answered without running the view.
+"""
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, make_response
+from flask_login import current_user
+
+from page_cache import PageCache
+
+
+def make_etag(version: str) -> str:
+    """
+    Builds the ETag of a page version. The auth state and query string are part
+    of it because the same rows render differently for different visitors.
+    """
+    salt = current_app.config.get("ETAG_SALT", "")
+    raw = f"{salt}|{version}|{request.query_string.decode()}|{PageCache.auth_state()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def is_fresh(etag: str, last_modified) -> bool:
+    """Checks the request validators against the current ones."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    # Last-Modified carries no auth state, so it is only trusted for anonymous visitors
+    if request.if_modified_since and last_modified and PageCache.auth_state() == "anon":
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def set_validators(response, etag: str, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
+
+
+def conditional(validator, anonymous_only: bool = False):
+    """
+    Decorator answering conditional GET requests with 304 Not Modified.
+    Args: validator (callable): Receives the view arguments and returns a tuple
+                                (version, last_modified) or None when the row does not exist.
+          anonymous_only (bool): Only validate pages of visitors that are not logged in, for pages
+                                 with forms whose CSRF token must not be reused from the browser cache.
+    """
+    def decorator(function):
+        @wraps(function)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ("GET", "HEAD") or (anonymous_only and current_user.is_authenticated):
+                return function(*args, **kwargs)
+            state = validator(**kwargs)
+            if state is None:
+                return function(*args, **kwargs)
+
+            version, last_modified = state
+            etag = make_etag(version)
+            if is_fresh(etag, last_modified):
+                return set_validators(current_app.response_class(status=304), etag, last_modified)
+
+            response = make_response(function(*args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return decorated_function
+    return decorator
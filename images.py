@@ -0,0 +1,227 @@
+"""
+Responsive derivatives of the category, post and background images.
+
+For every image under static/img/<folder>/ resized copies are written to
+static/img/derived/<folder>/<name>-<width>.<ext> in AVIF and WebP (when the
+installed Pillow can encode them) plus the original format. Templates use
+responsive_image() for <img> tags and masthead_css() for the header backgrounds.
+
+The variants are written out of band: "flask build-images" at deploy time, and
+schedule() in a background thread when an admin assigns an image. The helpers
+look the variants up on disk, so every worker serves them as soon as they exist
+and falls back to the original file until then, or when Pillow is missing.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+
+try:
+    from PIL import Image
+except ImportError:  # optional, pages then reference the originals
+    Image = None
+
+IMAGE_FOLDERS = ("category_images", "post_images", "background_images")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+# Modern formats first, browsers take the first <source> they support
+MODERN_FORMATS = (("AVIF", "avif", "image/avif"), ("WEBP", "webp", "image/webp"))
+FALLBACK_FORMATS = {".jpg": ("JPEG", "jpg"), ".jpeg": ("JPEG", "jpg"), ".png": ("PNG", "png"), ".webp": ("WEBP", "webp")}
+QUALITY = {"AVIF": 55, "WEBP": 75, "JPEG": 80}
+# Extensions of the written derivatives, in the order their sources are offered
+DERIVED_EXTENSIONS = (("avif", "image/avif"), ("webp", "image/webp"), ("jpg", "image/jpeg"), ("png", "image/png"))
+# Characters ending a quoted CSS string or the <style> element, written as CSS escapes
+CSS_ESCAPES = {"\\": "\\\\", '"': '\\"', "\n": "\\a ", "\r": "\\d ", "\f": "\\c ", "<": "\\3c ", ">": "\\3e "}
+
+
+def css_url(url: str) -> str:
+    """Quotes a URL for use in a stylesheet, e.g. url("/static/img/a.jpg")."""
+    return 'url("{}")'.format("".join(CSS_ESCAPES.get(character, character) for character in url))
+
+
+class ResponsiveImages():
+    """Flask extension generating image derivatives and the template helpers using them."""
+
+    def __init__(self, app=None):
+        # The background thread serves every application of the process, each job carries its app
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("IMAGES_DERIVED", "img/derived")
+        app.config.setdefault("IMAGES_WIDTHS", (480, 960, 1600))
+        app.config.setdefault("IMAGES_BUILD_ON_STARTUP", True)
+        app.extensions["images"] = self
+        app.jinja_env.globals["responsive_image"] = self.responsive_image
+        app.jinja_env.globals["masthead_css"] = self.masthead_css
+
+        if app.config["IMAGES_BUILD_ON_STARTUP"]:
+            with app.app_context():
+                self.build()
+
+        @app.cli.command("build-images")
+        def build_images_command():
+            """Generate resized AVIF/WebP variants of the site images."""
+            click.echo(f"Processed {len(self.build())} images")
+
+    def image_path(self, folder: str, filename: str):
+        """
+        Resolves an image inside one of IMAGE_FOLDERS.
+        Returns: str: Absolute path of the file, None when the name leaves the folder (e.g. "../../main.py").
+        """
+        if folder not in IMAGE_FOLDERS or not filename:
+            return None
+        root = os.path.realpath(os.path.join(current_app.static_folder, "img", folder))
+        path = os.path.realpath(os.path.join(root, filename))
+        return path if os.path.dirname(path) == root else None
+
+    def _derived_folder(self, folder: str) -> str:
+        return os.path.join(current_app.static_folder, current_app.config["IMAGES_DERIVED"], folder)
+
+    @property
+    def formats(self) -> list:
+        if Image is None:
+            return []
+        Image.init()
+        return [entry for entry in MODERN_FORMATS if entry[0] in Image.SAVE]
+
+    def schedule(self, folder: str, filename: str):
+        """Generates the derivatives of one image in a background thread, the request does not wait for Pillow."""
+        if Image is None:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="images")
+        self.executor.submit(self._generate_for, current_app._get_current_object(), folder, filename)
+
+    def _generate_for(self, app, folder: str, filename: str):
+        with app.app_context():
+            self.generate(folder, filename)
+
+    def generate(self, folder: str, filename: str) -> bool:
+        """
+        Writes the missing derivatives of one image.
+        Args: folder (str): One of IMAGE_FOLDERS.
+              filename (str): Name of the image inside that folder (BlogCategory.img_url, BlogPost.img_url).
+        Returns: bool: Whether the image could be processed.
+        """
+        source = self.image_path(folder, filename)
+        stem, extension = os.path.splitext(filename)
+        if Image is None or source is None or extension.lower() not in IMAGE_EXTENSIONS or not os.path.isfile(source):
+            return False
+        fallback_format, fallback_extension = FALLBACK_FORMATS[extension.lower()]
+        formats = [entry for entry in self.formats if entry[0] != fallback_format]
+        formats.append((fallback_format, fallback_extension, Image.MIME.get(fallback_format)))
+        target_folder = self._derived_folder(folder)
+        os.makedirs(target_folder, exist_ok=True)
+
+        with Image.open(source) as original:
+            for width in current_app.config["IMAGES_WIDTHS"]:
+                if width >= original.width:
+                    continue
+                resized = None
+                for image_format, image_extension, mimetype in formats:
+                    name = f"{stem}-{width}.{image_extension}"
+                    path = os.path.join(target_folder, name)
+                    if not os.path.exists(path):
+                        if resized is None:
+                            height = round(original.height * width / original.width)
+                            resized = original.resize((width, height), Image.LANCZOS)
+                            if resized.mode not in ("RGB", "RGBA"):
+                                resized = resized.convert("RGBA" if "transparency" in original.info else "RGB")
+                        image = resized.convert("RGB") if image_format == "JPEG" else resized
+                        temporary = path + ".tmp"
+                        image.save(temporary, format=image_format, quality=QUALITY.get(image_format, 80), optimize=True)
+                        os.replace(temporary, path)
+        return True
+
+    def build(self) -> list:
+        """
+        Generates the derivatives of every image in IMAGE_FOLDERS.
+        Returns: list: (folder, filename) of the images processed.
+        """
+        processed = []
+        for folder in IMAGE_FOLDERS:
+            directory = os.path.join(current_app.static_folder, "img", folder)
+            for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+                if self.generate(folder, filename):
+                    processed.append((folder, filename))
+        return processed
+
+    def variants(self, folder: str, filename: str) -> dict:
+        """
+        Finds the derivatives of one image on disk, whichever process wrote them.
+        Returns: dict: Maps mimetype to a list of (width, static filename), smallest first.
+        """
+        if self.image_path(folder, filename) is None:
+            return {}
+        directory = self._derived_folder(folder)
+        if not os.path.isdir(directory):
+            return {}
+        derived = set(os.listdir(directory))
+        stem = os.path.splitext(filename)[0]
+        variants = {}
+        for width in sorted(current_app.config["IMAGES_WIDTHS"]):
+            for extension, mimetype in DERIVED_EXTENSIONS:
+                name = f"{stem}-{width}.{extension}"
+                if name in derived:
+                    variants.setdefault(mimetype, []).append(
+                        (width, f"{current_app.config['IMAGES_DERIVED']}/{folder}/{name}"))
+        return variants
+
+    def original_width(self, folder: str, filename: str):
+        """Reads the width from the image header, None without Pillow."""
+        if Image is None:
+            return None
+        try:
+            with Image.open(self.image_path(folder, filename)) as original:
+                return original.width
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _srcset(entries: list) -> str:
+        return ", ".join(f"{url_for('static', filename=path)} {width}w" for width, path in entries)
+
+    def responsive_image(self, folder: str, filename: str, alt: str = "", class_: str = "",
+                         sizes: str = "100vw") -> Markup:
+        """<picture> with AVIF/WebP/original srcsets for an image of a category or post."""
+        original = url_for("static", filename=f"img/{folder}/{filename}")
+        variants = self.variants(folder, filename)
+        if not variants:
+            return Markup('<img class="{}" src="{}" alt="{}" loading="lazy">').format(class_, original, alt)
+        parts = ["<picture>"]
+        for mimetype, entries in variants.items():
+            if mimetype in ("image/avif", "image/webp"):
+                parts.append(f'<source type="{mimetype}" srcset="{escape(self._srcset(entries))}" '
+                             f'sizes="{escape(sizes)}">')
+        fallback = next((list(entries) for mimetype, entries in variants.items()
+                         if mimetype not in ("image/avif", "image/webp")), [])
+        width = self.original_width(folder, filename)
+        if width:
+            fallback.append((width, f"img/{folder}/{filename}"))
+        parts.append(f'<img class="{escape(class_)}" src="{escape(original)}" '
+                     f'srcset="{escape(self._srcset(fallback))}" sizes="{escape(sizes)}" '
+                     f'alt="{escape(alt)}" loading="lazy">')
+        parts.append("</picture>")
+        return Markup("".join(parts))
+
+    def masthead_css(self, folder: str, filename: str) -> Markup:
+        """
+        <style> block giving .masthead a background sized for the viewport,
+        in the best format the browser supports via image-set().
+        """
+        original = url_for("static", filename=f"img/{folder}/{filename}")
+        rules = [f".masthead {{ background-image: {css_url(original)}; }}"]
+        variants = self.variants(folder, filename)
+        widths = sorted({width for entries in variants.values() for width, _ in entries})
+        for index, width in enumerate(widths):
+            candidates = [f"{css_url(url_for('static', filename=path))} type(\"{mimetype}\")"
+                          for mimetype, entries in variants.items() for entry_width, path in entries
+                          if entry_width == width]
+            rule = f".masthead {{ background-image: image-set({', '.join(candidates)}); }}"
+            # Each width serves viewports up to itself, the original covers anything wider
+            lower = widths[index - 1] + 1 if index else 0
+            rules.append(f"@media (min-width: {lower}px) and (max-width: {width}px) {{ {rule} }}")
+        return Markup("<style>{}</style>").format(Markup("\n".join(rules)))
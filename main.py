@@ -1,42 +1,180 @@
-from flask import Flask, abort, render_template, redirect, url_for, flash, request
+from flask import Flask, Blueprint, abort, current_app, render_template, redirect, url_for, flash, request, stream_with_context
 from flask_bootstrap import Bootstrap5
-from flask_ckeditor import CKEditor
-from flask_gravatar import Gravatar
+from flask_gravatar import Gravatar, gravatar_hash
 from flask_login import UserMixin, login_user, LoginManager, login_required, current_user, logout_user
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Text, ForeignKey, select, desc
+from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column, load_only, contains_eager, joinedload, defer, validates
+from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, select, desc, update, delete, func
 from functools import wraps
+import click
 from werkzeug.security import generate_password_hash
+from sqlalchemy.exc import IntegrityError
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 
 from typing import List
 from forms import *
-from web_email import *
-import datetime, os
-
-
-# Loading app and all related modules
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get("FLASK_KEY")
-ckeditor = CKEditor(app)
-Bootstrap5(app)
+from page_cache import PageCache
+from template_cache import TemplateCache
+from rate_limit import RateLimiter
+from http_cache import conditional
+from user_cache import UserCache, UserSnapshot
+from assets import Assets
+from images import ResponsiveImages
+from metrics import Metrics
+from db_routing import RoutingSession, enable_sqlite_foreign_keys, pool_options, read_replica
+import migrations
+import search_index
+import feeds
+from html_utils import html_to_text, sanitize_comment, sanitize_html, make_excerpt
+import datetime, functools, os
+
+
+# Extensions are bound to the application in create_app()
+bootstrap = Bootstrap5()
+images = ResponsiveImages()
+assets = Assets()
 login_manager = LoginManager()
-login_manager.init_app(app)
-gravatar = Gravatar(app,
-                    size=100,
+gravatar = Gravatar(size=100,
                     rating='g',
                     default='retro',
                     force_default=False,
+                    force_lower=True,
                     use_ssl=False,
-                    base_url=None)
+                    base_url=None,
+                    cache_size=int(os.environ.get("GRAVATAR_CACHE_SIZE", 1024)))
 
 # Creating connection with database
 class Base(DeclarativeBase):
     pass
-app.config['SQLALCHEMY_DATABASE_URI'] =  os.environ.get("DB_URI" )
-db = SQLAlchemy(model_class=Base)
-db.init_app(app)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+page_cache = PageCache()
+template_cache = TemplateCache()
+rate_limiter = RateLimiter()
+user_cache = UserCache()
+# /metrics is readable with METRICS_TOKEN or by the admin
+metrics = Metrics(authorize=lambda: current_user.is_authenticated and current_user.id == 1)
+metrics.add_cache("page", lambda: (page_cache.hits, page_cache.misses))
+metrics.add_cache("fragment", lambda: (template_cache.hits, template_cache.misses))
+metrics.add_cache("user", lambda: (user_cache.hits, user_cache.misses))
+metrics.add_cache("gravatar", lambda: (gravatar.hits, gravatar.misses))
+
+# Every route of the blog, registered on the application by create_app()
+blog = Blueprint("blog", __name__, cli_group=None)
+
+
+def configure(app: Flask):
+    """Reads the configuration from the environment."""
+    app.config['SECRET_KEY'] = os.environ.get("FLASK_KEY")
+    # Password hashing policy, stored hashes using other parameters are rehashed on the next login
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get("PASSWORD_SALT_LENGTH", 8))
+    # Resized AVIF/WebP image variants, generated by "flask build-images" and in the background when an image is assigned
+    app.config['IMAGES_BUILD_ON_STARTUP'] = os.environ.get("IMAGES_BUILD_ON_STARTUP", "0") == "1"
+    # Fingerprinted static files, built by "flask build-assets" at deploy time unless this is set
+    app.config['ASSETS_BUILD_ON_STARTUP'] = os.environ.get("ASSETS_BUILD_ON_STARTUP", "0") == "1"
+
+    app.config['SQLALCHEMY_DATABASE_URI'] =  os.environ.get("DB_URI" )
+    # Pool tuning per worker: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING=1
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options(os.environ)
+    # Optional read replica for the public pages, users read the primary for DB_REPLICA_LAG seconds after writing
+    if os.environ.get("DB_REPLICA_URI"):
+        app.config['SQLALCHEMY_BINDS'] = {"replica": {"url": os.environ["DB_REPLICA_URI"],
+                                                      **app.config['SQLALCHEMY_ENGINE_OPTIONS']}}
+    app.config['DB_REPLICA_LAG'] = float(os.environ.get("DB_REPLICA_LAG", 5))
+    app.config['POSTS_PER_PAGE'] = int(os.environ.get("POSTS_PER_PAGE", 10))
+    app.config['COMMENTS_PER_PAGE'] = int(os.environ.get("COMMENTS_PER_PAGE", 0)) # 0 shows every comment
+    app.config['COMMENTS_API_LIMIT'] = int(os.environ.get("COMMENTS_API_LIMIT", 50)) # largest page of the comments API
+    app.config['SEARCH_RESULTS_PER_PAGE'] = int(os.environ.get("SEARCH_RESULTS_PER_PAGE", 10))
+    app.config['FEED_TITLE'] = os.environ.get("FEED_TITLE", "Blog")
+    app.config['FEED_LENGTH'] = int(os.environ.get("FEED_LENGTH", 20))
+    app.config['STATIC_EXPORT'] = False # set by "flask export" for the read-only pages it renders
+
+    # Rendered page cache, PAGE_CACHE_URL="sqlite:////path/cache.db" shares it between workers
+    app.config['PAGE_CACHE_ENABLED'] = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+    app.config['PAGE_CACHE_URL'] = os.environ.get("PAGE_CACHE_URL", "memory")
+    app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 512))
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get("PAGE_CACHE_TTL", 300))
+    # Tag versions invalidating the cached pages and users of every worker, see page_cache.tags_url()
+    app.config['CACHE_TAGS_URL'] = os.environ.get("CACHE_TAGS_URL")
+
+    # Token buckets per IP and user for the form posts, RATE_LIMIT_URL="sqlite:////path/limits.db" shares them
+    # between workers and RATE_LIMIT_<VIEW>="<tokens>/<second|minute|hour|seconds>" overrides a view's limit
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+    app.config['RATE_LIMIT_URL'] = os.environ.get("RATE_LIMIT_URL", "memory")
+    for name in ("COMMENT", "LOGIN", "REGISTER", "CONTACT"):
+        if os.environ.get(f"RATE_LIMIT_{name}"):
+            app.config[f'RATE_LIMIT_{name}'] = os.environ[f"RATE_LIMIT_{name}"]
+
+    # Compiled templates on disk for fast worker startup ("flask compile-templates" fills it during deploy)
+    app.config['TEMPLATE_BYTECODE_CACHE'] = os.environ.get("TEMPLATE_BYTECODE_CACHE", "1") == "1"
+    app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = os.environ.get("TEMPLATE_BYTECODE_CACHE_DIR")
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get("FRAGMENT_CACHE_TTL", 3600))
+
+    # Logged in users are served from memory instead of querying the users table per request
+    app.config['USER_CACHE_TTL'] = int(os.environ.get("USER_CACHE_TTL", 300))
+    app.config['USER_CACHE_MAX_ENTRIES'] = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 1024))
+
+    # Latency, SQL and cache metrics at /metrics, slow requests are logged with their statements
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get("SLOW_REQUEST_MS", 500))
+    app.config['SLOW_REQUEST_QUERIES'] = int(os.environ.get("SLOW_REQUEST_QUERIES", 20))
+    app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN")
+
+    # Background delivery of the contact form outbox. gunicorn.conf.py and __main__ start it for the server,
+    # this starts it in every application created, CLI commands and the static export included
+    app.config['MAIL_DELIVERY_ON_STARTUP'] = os.environ.get("MAIL_DELIVERY_ON_STARTUP", "0") == "1"
+
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Builds the application. Nothing touches the database here, the schema is
+    managed with "flask --app main migrate".
+    Args: config (dict): Overrides of the environment configuration.
+    Returns: Flask: The configured application.
+    """
+    # Only needed for the post editor, imported when an application is built
+    from flask_ckeditor import CKEditor
+
+    app = Flask(__name__)
+    configure(app)
+    app.config.update(config or {})
+
+    CKEditor(app)
+    bootstrap.init_app(app)
+    images.init_app(app)
+    assets.init_app(app)
+    login_manager.init_app(app)
+    gravatar.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            enable_sqlite_foreign_keys(engine)
+    page_cache.init_app(app)
+    template_cache.init_app(app)
+    rate_limiter.init_app(app)
+    user_cache.init_app(app)
+    metrics.init_app(app)
+    app.register_blueprint(blog)
+    if app.config['MAIL_DELIVERY_ON_STARTUP']:
+        # Messages left in the outbox by a previous worker are delivered without waiting for a new one
+        from web_email import mailer
+        mailer.start()
+    return app
+
+
+def __getattr__(name: str):
+    # "main:app" (gunicorn, flask --app main) builds the application on first access
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def utcnow() -> datetime.datetime:
+    """Naive UTC timestamp used for the change tracking columns."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 
 # CONFIGURE TABLES
@@ -47,8 +185,14 @@ class BlogCategory(db.Model):
     subtitle: Mapped[str] = mapped_column(String(250), nullable=False)
     img_url: Mapped[str] = mapped_column(String(250), nullable=False)
     author: Mapped["User"] = relationship(back_populates="categories")
-    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-    posts: Mapped[List["BlogPost"]] = relationship(back_populates="category")
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    # Deleting a category removes its posts in the database (ON DELETE CASCADE), nothing is loaded
+    posts: Mapped[List["BlogPost"]] = relationship(back_populates="category", cascade="all, delete-orphan",
+                                                   passive_deletes=True)
+    # Maintained by the post routes through touch(), rebuilt by "flask --app main reconcile-counts"
+    post_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped whenever the category or the list of its posts changes
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
 
 
 class BlogPost(db.Model):
@@ -57,24 +201,39 @@ class BlogPost(db.Model):
     title: Mapped[str] = mapped_column(String(250), unique=True, nullable=False)
     subtitle: Mapped[str] = mapped_column(String(250), nullable=False)
     body: Mapped[str] = mapped_column(Text, nullable=False)
+    # Render artifacts derived from body whenever it is set, pages only read these
+    body_html: Mapped[str] = mapped_column(Text, nullable=False)
+    excerpt: Mapped[str] = mapped_column(String(300), nullable=False)
     img_url: Mapped[str] = mapped_column(String(250), nullable=False)
-    date: Mapped[str] = mapped_column(String(250), nullable=False)
+    date: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
     
     author: Mapped["User"] = relationship(back_populates="posts")
-    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
 
     category: Mapped["BlogCategory"] = relationship(back_populates="posts")
-    category_id: Mapped[int] = mapped_column(ForeignKey("blog_categories.id"))
+    category_id: Mapped[int] = mapped_column(ForeignKey("blog_categories.id", ondelete="CASCADE"), index=True)
+
+    comments: Mapped[List["Comment"]] = relationship(back_populates="parent_post", cascade="all, delete-orphan",
+                                                     passive_deletes=True)
+    comment_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped whenever the post or its comments change
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
 
-    comments: Mapped[List["Comment"]] = relationship(back_populates="parent_post")
+    @validates("body")
+    def render_body(self, key, body):
+        """Sanitizes and minifies the CKEditor source once, on write."""
+        self.body_html = sanitize_html(body)
+        self.excerpt = make_excerpt(html_to_text(body))
+        return body
 
 
 class User(db.Model, UserMixin):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(100), unique=False, nullable=False)
-    password: Mapped[str] = mapped_column(String(100), unique=False, nullable=False)
+    password: Mapped[str] = mapped_column(String(255), unique=False, nullable=False)
     email: Mapped[str] = mapped_column(String(250), unique=True, nullable=False)
+    email_hash: Mapped[str] = mapped_column(String(32), nullable=True) # Gravatar hash, computed at registration
     posts: Mapped[List["BlogPost"]] = relationship(back_populates="author")
     comments: Mapped[List["Comment"]] = relationship(back_populates="author")
     categories: Mapped[List["BlogCategory"]] = relationship(back_populates="author")
@@ -84,23 +243,79 @@ class Comment(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     author: Mapped["User"] = relationship(back_populates="comments")
-    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     parent_post: Mapped["BlogPost"] = relationship(back_populates="comments")
-    parent_post_id: Mapped[int] = mapped_column(ForeignKey("blog_posts.id"))
-    posted_time : Mapped[str] = mapped_column(Text, nullable=False) # TODO add time function which calculates the time from post being posted
+    parent_post_id: Mapped[int] = mapped_column(ForeignKey("blog_posts.id", ondelete="CASCADE"), index=True)
+    posted_time : Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False) # TODO add time function which calculates the time from post being posted
+
+
+@functools.lru_cache(maxsize=1)
+def _year(day: int) -> str:
+    return datetime.date.fromordinal(day).strftime("%Y")
 
 
 class VariableManager():
+    """
+    Flags of the page being rendered. The values shared by every page are class
+    attributes; current_user is the proxy itself, resolved when a template reads it.
+    """
+    __slots__ = ("edit", "send_email")
+    current_user = current_user
+    author = "Lukas Sofka"
+
     def __init__(self, edit:bool=False, send_email:bool=False):
-        self.current_user = current_user
-        self.year = datetime.datetime.now().strftime("%Y")
-        self.author = "Lukas Sofka"
         self.edit = edit
         self.send_email = send_email
 
-
-with app.app_context():
-    db.create_all()
+    @property
+    def year(self) -> str:
+        # Computed once per day
+        return _year(datetime.date.today().toordinal())
+
+
+# Schema changes are applied out-of-band with "flask --app main migrate", never at import
+@blog.cli.command("migrate")
+def migrate_command():
+    """Apply pending database migrations."""
+    applied = migrations.upgrade(db.engine)
+    for name in applied:
+        click.echo(f"Applied {name}")
+    if not applied:
+        click.echo("Database is up to date")
+
+
+@blog.cli.command("reindex")
+def reindex_command():
+    """Rebuild the full-text search index."""
+    with db.engine.begin() as connection:
+        count = search_index.rebuild(connection)
+    click.echo(f"Indexed {count} posts")
+
+
+@blog.cli.command("export")
+@click.argument("output", type=click.Path(file_okay=False))
+@click.option("--base-url", default="http://localhost", show_default=True,
+              help="Public URL of the exported site, used by the feeds.")
+@click.option("--processes", type=int, default=None, help="Worker processes, defaults to the number of CPUs.")
+@click.option("--full", is_flag=True, help="Render every page, not only the changed ones.")
+def export_command(output, base_url, processes, full):
+    """Render the public pages to static files."""
+    import static_export
+    result = static_export.export(output, base_url=base_url.rstrip("/"), processes=processes, full=full)
+    click.echo(f"Rendered {result.rendered} pages, removed {result.removed}, {result.unchanged} unchanged")
+    for path, status in result.failed:
+        click.echo(f"Failed {path}: {status}", err=True)
+    if result.failed:
+        raise click.ClickException(f"{len(result.failed)} pages failed")
+
+
+@blog.cli.command("reconcile-counts")
+def reconcile_counts_command():
+    """Recompute the post and comment counters from the tables."""
+    categories, posts = reconcile_counts()
+    db.session.commit()
+    page_cache.clear()
+    click.echo(f"Corrected {categories} categories and {posts} posts")
 
 
 # Authentication Functions
@@ -108,10 +323,11 @@ with app.app_context():
 def load_user(user_id):
     """
     Loads a user by their ID for session management.
+    The user is served from user_cache when possible.
     Args: user_id (int): The ID of the user to be loaded.
-    Returns: User: The user object if found, otherwise raises a 404 error.
+    Returns: UserSnapshot: The cached user if found, otherwise raises a 404 error.
     """
-    return db.get_or_404(User, user_id)
+    return user_cache.load(user_id, lambda: UserSnapshot.from_user(db.get_or_404(User, user_id)))
 
 
 
@@ -121,7 +337,7 @@ def handle_unauthorized_access():
     Redirects the user to the login page if they attempt to access an endpoint
     that requires authentication without being logged in.
     """
-    return redirect(url_for("login"))
+    return redirect(url_for("blog.login"))
 
 
 def admin_only(function)->bool:
@@ -131,7 +347,7 @@ def admin_only(function)->bool:
     @wraps(function)
     def decorated_function(*args, **kwargs):
         if current_user.is_anonymous:
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('blog.login', next=request.url))
         elif current_user.id == 1:
             return function(*args, **kwargs)
         else:
@@ -153,7 +369,19 @@ def only_commenter(function)->bool:
 
 
 def hash_password(password: str)->str:
-    return generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
+    return generate_password_hash(password,
+                                  method=current_app.config['PASSWORD_HASH_METHOD'],
+                                  salt_length=current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def password_needs_rehash(password_hash: str)->bool:
+    """
+    Check whether a stored hash was made with other parameters than the current policy.
+    Werkzeug stores hashes as "<method>$<salt>$<hash>".
+    """
+    method, _, rest = password_hash.partition("$")
+    salt = rest.partition("$")[0]
+    return method != current_app.config['PASSWORD_HASH_METHOD'] or len(salt) != current_app.config['PASSWORD_SALT_LENGTH']
 
 
 def check_image(img: str)->str:
@@ -163,49 +391,290 @@ def check_image(img: str)->str:
         return img
 
 
+def reconcile_counts() -> tuple:
+    """
+    Recomputes BlogCategory.post_count and BlogPost.comment_count with one UPDATE each.
+    Returns: tuple: Number of corrected (categories, posts), the caller commits.
+    """
+    post_count = (select(func.count()).select_from(BlogPost)
+                  .where(BlogPost.category_id == BlogCategory.id).scalar_subquery())
+    comment_count = (select(func.count()).select_from(Comment)
+                     .where(Comment.parent_post_id == BlogPost.id).scalar_subquery())
+    categories = db.session.execute(update(BlogCategory).where(BlogCategory.post_count != post_count)
+                                    .values(post_count=post_count)).rowcount
+    posts = db.session.execute(update(BlogPost).where(BlogPost.comment_count != comment_count)
+                               .values(comment_count=comment_count)).rowcount
+    return categories, posts
+
+
+def touch(model, id: int, **counters):
+    """
+    Marks a row as changed so its pages get new HTTP validators.
+    Counter columns are adjusted in the same UPDATE, relative to the stored value,
+    so concurrent requests never overwrite each other's counts.
+    Args: model: BlogCategory or BlogPost.
+          id (int): Primary key of the row.
+          counters: Column name to increment, e.g. post_count=1.
+    """
+    values = {name: getattr(model, name) + delta for name, delta in counters.items()}
+    db.session.execute(update(model).where(model.id == id).values(updated_at=utcnow(), **values))
+
+
+def delete_posts(*criteria) -> int:
+    """
+    Deletes the matching posts with their comments and search rows, one statement per table
+    instead of loading every row. Runs in the current transaction, the caller commits.
+    Args: criteria: WHERE clauses on BlogPost.
+    Returns: int: Number of deleted posts.
+    """
+    post_ids = select(BlogPost.id).where(*criteria)
+    search_index.remove_posts(db.session, db.session.scalars(post_ids).all())
+    db.session.execute(delete(Comment).where(Comment.parent_post_id.in_(post_ids)),
+                       execution_options={"synchronize_session": False})
+    return db.session.execute(delete(BlogPost).where(*criteria),
+                              execution_options={"synchronize_session": False}).rowcount
+
+
+def category_version(id: int, before: int = None):
+    """
+    Validator for the category page.
+    Returns: tuple: (version, last_modified) or None if the category does not exist.
+    """
+    updated_at = db.session.execute(db.select(BlogCategory.updated_at).where(BlogCategory.id == id)).scalar()
+    if updated_at is None:
+        return None
+    return f"category:{id}:{before}:{updated_at.isoformat()}", updated_at
+
+
+def post_version(c_id: int, p_id: int):
+    """
+    Validator for the post page.
+    Returns: tuple: (version, last_modified) or None if the post does not exist.
+    """
+    updated_at = db.session.execute(db.select(BlogPost.updated_at)
+                                    .where(BlogPost.id == p_id, BlogPost.category_id == c_id)).scalar()
+    if updated_at is None:
+        return None
+    return f"post:{p_id}:{updated_at.isoformat()}", updated_at
+
+
+def feed_version(kind: str, id: int = None):
+    """
+    Validator for the feeds. Every post change bumps the updated_at of its category.
+    Returns: tuple: (version, last_modified) or None if there is no matching category.
+    """
+    query = db.select(func.max(BlogCategory.updated_at), func.count(BlogCategory.id))
+    if id is not None:
+        query = query.where(BlogCategory.id == id)
+    updated_at, count = db.session.execute(query).one()
+    if updated_at is None:
+        return None
+    return f"feed:{kind}:{id}:{count}:{updated_at.isoformat()}", updated_at
+
+
+def feed_entries(category_id: int = None):
+    """
+    Yields the newest FEED_LENGTH posts as feed entries, read in small batches
+    while the response is being streamed.
+    Args: category_id (int): Restricts the entries to one category.
+    """
+    query = (db.select(BlogPost)
+             .outerjoin(BlogPost.author)
+             .options(load_only(BlogPost.id, BlogPost.title, BlogPost.excerpt, BlogPost.body_html,
+                                BlogPost.date, BlogPost.updated_at, BlogPost.category_id),
+                      contains_eager(BlogPost.author).load_only(User.username))
+             .order_by(BlogPost.date.desc(), BlogPost.id.desc())
+             .limit(current_app.config['FEED_LENGTH'])
+             .execution_options(yield_per=10))
+    if category_id is not None:
+        query = query.where(BlogPost.category_id == category_id)
+    for post in db.session.execute(query).scalars():
+        yield feeds.Entry(id=post.id,
+                          title=post.title,
+                          link=url_for("blog.view_post", c_id=post.category_id, p_id=post.id, _external=True),
+                          summary=post.excerpt,
+                          content_html=post.body_html,
+                          author=post.author.username if post.author else "",
+                          published=post.date,
+                          updated=post.updated_at)
+
+
+def category_page(category_id: int, before: int = None) -> tuple:
+    """
+    Loads one newest-first page of post previews for a category.
+    Only the columns shown in the preview are selected and authors are joined
+    in the same query. Pages are keyset-paginated on BlogPost.id.
+    Args: category_id (int): The category to list.
+          before (int): Only posts with a lower id are returned (cursor).
+    Returns: tuple: (posts, next_cursor), next_cursor is None on the last page.
+    """
+    per_page = current_app.config['POSTS_PER_PAGE']
+    query = (db.select(BlogPost)
+             .outerjoin(BlogPost.author)
+             .options(load_only(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.excerpt, BlogPost.category_id,
+                                BlogPost.comment_count),
+                      contains_eager(BlogPost.author).load_only(User.username))
+             .where(BlogPost.category_id == category_id)
+             .order_by(BlogPost.id.desc())
+             .limit(per_page + 1))
+    if before is not None:
+        query = query.where(BlogPost.id < before)
+    posts = db.session.execute(query).scalars().all()
+    next_cursor = posts[per_page - 1].id if len(posts) > per_page else None
+    return posts[:per_page], next_cursor
+
+
+def load_post(c_id: int, p_id: int) -> BlogPost:
+    """
+    Loads a post by primary key together with its author in one query.
+    The editor source in BlogPost.body is not loaded, pages render BlogPost.body_html.
+    Args: c_id (int): Category the post must belong to.
+          p_id (int): The ID of the post.
+    Returns: BlogPost: The post, otherwise raises a 404 error.
+    """
+    post = db.session.execute(db.select(BlogPost)
+                              .options(defer(BlogPost.body),
+                                       joinedload(BlogPost.author).load_only(User.username))
+                              .where(BlogPost.id == p_id, BlogPost.category_id == c_id)).scalar()
+    if post is None:
+        abort(404)
+    return post
+
+
+def post_comments(post_id: int, after: int = None, per_page: int = None) -> tuple:
+    """
+    Loads the comments of a post oldest-first with their authors joined.
+    When COMMENTS_PER_PAGE is set the comments are keyset-paginated on Comment.id.
+    Args: post_id (int): The ID of the post.
+          after (int): Only comments with a higher id are returned (cursor).
+          per_page (int): Page size instead of COMMENTS_PER_PAGE, 0 returns every comment.
+    Returns: tuple: (comments, next_cursor), next_cursor is None on the last page.
+    """
+    if per_page is None:
+        per_page = current_app.config['COMMENTS_PER_PAGE']
+    query = (db.select(Comment)
+             .options(joinedload(Comment.author).load_only(User.username, User.email, User.email_hash))
+             .where(Comment.parent_post_id == post_id)
+             .order_by(Comment.id))
+    if after is not None:
+        query = query.where(Comment.id > after)
+    if not per_page:
+        return db.session.execute(query).scalars().all(), None
+    comments = db.session.execute(query.limit(per_page + 1)).scalars().all()
+    next_cursor = comments[per_page - 1].id if len(comments) > per_page else None
+    return comments[:per_page], next_cursor
+
+
+def add_comment(c_id: int, p_id: int, text: str) -> Comment:
+    """
+    Stores a comment of the current user and updates the counters, validators,
+    search index and cached pages of its post and category.
+    Args: c_id (int): Category of the post.
+          p_id (int): The ID of the post.
+          text (str): Validated CommentForm.body data, stored sanitized for the page and the API.
+    Returns: Comment: The committed comment.
+    """
+    new_comment = Comment(text=sanitize_comment(text),
+                          author_id=current_user.id,
+                          parent_post_id=p_id,
+                          posted_time=datetime.datetime.now())
+    db.session.add(new_comment)
+    db.session.flush()
+    touch(BlogPost, p_id, comment_count=1)
+    # The category page shows the comment count of its posts
+    touch(BlogCategory, c_id)
+    search_index.index_comment(db.session, new_comment.id)
+    db.session.commit()
+    page_cache.invalidate(f"category:{c_id}", f"post:{p_id}")
+    return new_comment
+
+
+def comment_json(comment: Comment, author: str, avatar: str, c_id: int) -> dict:
+    """Representation of a comment in the comments API, text is the sanitized HTML stored by add_comment()."""
+    data = {"id": comment.id,
+            "text": comment.text,
+            "author_id": comment.author_id,
+            "author": author,
+            "avatar": avatar,
+            "posted_time": comment.posted_time.isoformat(timespec="seconds"),
+            "delete_url": None}
+    if current_user.is_authenticated and comment.author_id == current_user.id:
+        data["delete_url"] = url_for("blog.delete_comment", c_id=c_id, p_id=comment.parent_post_id,
+                                     comment_id=comment.id)
+    return data
+
+
+def avatar_hash(email: str) -> str:
+    """Gravatar hash of an email, computed from the trimmed, lowercased address as Gravatar expects."""
+    return gravatar_hash(email.strip(), force_lower=True)
+
+
+def comment_avatars(comments: list) -> dict:
+    """
+    Builds the gravatar links of all comment authors in one call.
+    Args: comments (list): Comments with their authors loaded.
+    Returns: dict: Maps author_id to the gravatar URL.
+    """
+    authors = {comment.author_id: comment.author for comment in comments}
+    hashes = [author.email_hash or avatar_hash(author.email) for author in authors.values()]
+    return dict(zip(authors.keys(), gravatar.bulk(hashes, hashed=True)))
+
+
 # User Authentication Pages
-@app.route('/register', methods=["GET", "POST"])
+@blog.route('/register', methods=["GET", "POST"])
+@rate_limiter.limit("register", "5/hour")
 def register():
     register_form = RegisterForm(db=db, User=User)
+    # RegisterForm.validate_email already rejects known emails, the unique constraint covers races
     if register_form.validate_on_submit():
-        if db.session.execute(db.select(User).where(User.email == register_form.email.data)).scalar():
-            flash("Email already in use")
-            return redirect(url_for("register"))
-        
-        else:
-            hashed_password = hash_password(password=register_form.password.data)
-            new_user = User(username=register_form.username.data, password=hashed_password, email=register_form.email.data)
-            db.session.add(new_user)
+        hashed_password = hash_password(password=register_form.password.data)
+        new_user = User(username=register_form.username.data,
+                        password=hashed_password,
+                        email=register_form.email.data,
+                        email_hash=avatar_hash(register_form.email.data))
+        db.session.add(new_user)
+        try:
             db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("Email already in use")
+            return redirect(url_for("blog.register"))
 
-            login_user(new_user)
-            return redirect(url_for("main_hub"))
+        login_user(new_user)
+        return redirect(url_for("blog.main_hub"))
     return render_template("register.html",
                            variables=VariableManager(),
                            form=register_form)
 
 
-@app.route('/login', methods=["POST", "GET"])
+@blog.route('/login', methods=["POST", "GET"])
+@rate_limiter.limit("login", "10/minute")
 def login():
     login_form = LoginForm(db=db, User=User)
     if login_form.validate_on_submit():
-        user = db.session.execute(db.select(User).where(User.email == login_form.email.data)).scalar()
+        user = login_form.user
+        if password_needs_rehash(user.password):
+            user.password = hash_password(password=login_form.password.data)
+            db.session.commit()
+            user_cache.invalidate(user.id)
         login_user(user)
-        return redirect(url_for("main_hub"))
+        return redirect(url_for("blog.main_hub"))
     return render_template("login.html",
                            variables=VariableManager(),
                            form=login_form)
 
 
-@app.route('/logout')
+@blog.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for("main_hub"))
+    return redirect(url_for("blog.main_hub"))
 
 
 # Content pages 
-@app.route('/')
+@blog.route('/')
+@read_replica
+@page_cache.cached(tags=lambda: ["categories"])
 def main_hub():
     categories_result = db.session.execute(db.select(BlogCategory))
     categories = categories_result.scalars().all()
@@ -213,7 +682,7 @@ def main_hub():
                            variables=VariableManager(),
                            categories=categories)
 
-@app.route("/new-category", methods=["GET", "POST"])
+@blog.route("/new-category", methods=["GET", "POST"])
 @admin_only
 def new_category():
     category_form = CategoryForm()
@@ -221,26 +690,38 @@ def new_category():
         new_category = BlogCategory(title=category_form.title.data,
                                     subtitle=category_form.subtitle.data,
                                     img_url = category_form.img_url.data,
-                                    author=current_user)
+                                    author_id=current_user.id)
         db.session.add(new_category)
         db.session.commit()
+        page_cache.invalidate("categories")
+        images.schedule("category_images", new_category.img_url)
 
-        return redirect(url_for("main_hub"))
+        return redirect(url_for("blog.main_hub"))
     return render_template("new_category.html",
                            variables=VariableManager(edit=False),
                            form=category_form)
 
 
-@app.route("/category/<int:id>")
-def view_category(id):
-    category_result = db.session.execute(select(BlogCategory).where(BlogCategory.id == id))
-    category = category_result.scalar()
+@blog.route("/category/<int:id>")
+@blog.route("/category/<int:id>/before/<int:before>")
+@read_replica
+@conditional(category_version)
+@page_cache.cached(tags=lambda id, before=None: [f"category:{id}"])
+def view_category(id, before=None):
+    if before is None:
+        # The cursor is accepted as ?before=<id> as well as in the path
+        before = request.args.get("before", type=int)
+    category = db.get_or_404(BlogCategory, id)
+    posts, next_cursor = category_page(category_id=id, before=before)
     return render_template("category.html",
                            variables=VariableManager(),
-                           category=category)
+                           category=category,
+                           posts=posts,
+                           before=before,
+                           next_cursor=next_cursor)
 
 
-@app.route("/edit-category/<int:c_id>", methods=["GET", "POST"])
+@blog.route("/edit-category/<int:c_id>", methods=["GET", "POST"])
 @admin_only
 def edit_category(c_id):
     id = c_id
@@ -254,7 +735,9 @@ def edit_category(c_id):
         category.subtitle = edit_form.subtitle.data
         category.img_url = edit_form.img_url.data
         db.session.commit()
-        return redirect(url_for("view_category", id=id))
+        page_cache.invalidate("categories", f"category:{id}")
+        images.schedule("category_images", category.img_url)
+        return redirect(url_for("blog.view_category", id=id))
     
     return render_template("new_category.html",
                            variables=VariableManager(edit=True),
@@ -262,64 +745,116 @@ def edit_category(c_id):
                            id=id)
 
 
-@app.route("/delete/<string:item>/<int:id>", methods=["GET", "POST"])
+@blog.route("/delete/<string:item>/<int:id>", methods=["GET", "POST"])
 @admin_only
 def delete_item(item, id):
     if item == "category":
-        result = db.session.execute(db.select(BlogCategory).where(BlogCategory.id == id)).scalar()
+        db.first_or_404(select(BlogCategory.id).where(BlogCategory.id == id))
+        stale_tags = ("categories", "feed", f"category:{id}")
+        delete_posts(BlogPost.category_id == id)
+        db.session.execute(delete(BlogCategory).where(BlogCategory.id == id),
+                           execution_options={"synchronize_session": False})
     elif item == "post":
-        result = db.session.execute(db.select(BlogPost).where(BlogPost.id == id)).scalar()
+        category_id = db.first_or_404(select(BlogPost.category_id).where(BlogPost.id == id))
+        stale_tags = ("categories", "feed", f"category:{category_id}", f"post:{id}")
+        touch(BlogCategory, category_id, post_count=-delete_posts(BlogPost.id == id))
     else:
         flash("Invalid item type")
-    
-    db.session.delete(result)
-    db.session.commit()
-    return redirect(url_for("main_hub"))
+        return redirect(url_for("blog.main_hub"))
 
-# TODO Make posts accessible
-@app.route("/category/<int:c_id>/post/<int:p_id>", methods=["GET", "POST"])
-@login_required
+    db.session.commit()
+    page_cache.invalidate(*stale_tags)
+    return redirect(url_for("blog.main_hub"))
+
+@blog.route("/category/<int:c_id>/post/<int:p_id>", methods=["GET", "POST"])
+@rate_limiter.limit("comment", "10/minute")
+@read_replica
+@conditional(post_version, anonymous_only=True)
+@page_cache.cached(tags=lambda c_id, p_id: [f"category:{c_id}", f"post:{p_id}"], anonymous_only=True)
 def view_post(c_id, p_id):
-    category_result = db.session.execute(db.select(BlogCategory).where(BlogCategory.id == c_id)).scalar()
-    post = [post for post in category_result.posts if post.id == p_id]
+    if request.method == "POST" and not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    post = load_post(c_id=c_id, p_id=p_id)
     comment_form = CommentForm()
     if comment_form.validate_on_submit():
-        new_comment = Comment(text=comment_form.body.data,
-                              author_id=current_user.id,
-                              parent_post_id=p_id,
-                              posted_time=datetime.datetime.now().strftime("%d/%m/%Y"))
-        db.session.add(new_comment)
-        db.session.commit()
-        return redirect(url_for("view_post", c_id=c_id, p_id=p_id))
+        add_comment(c_id=c_id, p_id=p_id, text=comment_form.body.data)
+        return redirect(url_for("blog.view_post", c_id=c_id, p_id=p_id))
+    comments_after = request.args.get("comments_after", type=int)
+    comments, next_comments = post_comments(post_id=p_id, after=comments_after)
     return render_template("post.html",
                            variables=VariableManager(),
-                           post=post[0],
-                           form=comment_form) 
-
-
-@app.route("/category/<int:c_id>/new-post", methods=["GET", "POST"])
+                           post=post,
+                           comments=comments,
+                           avatars=comment_avatars(comments),
+                           comments_after=comments_after,
+                           next_comments=next_comments,
+                           form=comment_form)
+
+
+# Comments API used by static/js/comments.js to append comments without reloading the post
+@blog.route("/api/category/<int:c_id>/post/<int:p_id>/comments")
+@read_replica
+@conditional(post_version, anonymous_only=True)
+def api_comments(c_id, p_id):
+    db.first_or_404(select(BlogPost.id).where(BlogPost.id == p_id, BlogPost.category_id == c_id))
+    limit = min(max(request.args.get("limit", current_app.config['COMMENTS_API_LIMIT'], type=int), 1),
+                current_app.config['COMMENTS_API_LIMIT'])
+    comments, next_cursor = post_comments(post_id=p_id, after=request.args.get("after", type=int), per_page=limit)
+    avatars = comment_avatars(comments)
+    return {"comments": [comment_json(comment, comment.author.username, avatars[comment.author_id], c_id)
+                         for comment in comments],
+            "next": next_cursor}
+
+
+@blog.route("/api/category/<int:c_id>/post/<int:p_id>/comments", methods=["POST"])
+@rate_limiter.limit("comment", "10/minute")
+def api_add_comment(c_id, p_id):
+    if not current_user.is_authenticated:
+        return {"error": "Log in to leave a comment."}, 401
+    # The token travels in the X-CSRFToken header, the JSON body only carries the comment
+    if current_app.config.get("WTF_CSRF_ENABLED", True):
+        try:
+            validate_csrf(request.headers.get("X-CSRFToken"))
+        except ValidationError as error:
+            return {"error": str(error)}, 400
+    db.first_or_404(select(BlogPost.id).where(BlogPost.id == p_id, BlogPost.category_id == c_id))
+    comment_form = CommentForm(meta={"csrf": False})
+    if not comment_form.validate_on_submit():
+        return {"error": "Invalid comment.", "fields": comment_form.errors}, 400
+    new_comment = add_comment(c_id=c_id, p_id=p_id, text=comment_form.body.data)
+    # The author is the cached current user, loading the relationship would query the users table
+    avatar = gravatar.bulk([current_user.email_hash or avatar_hash(current_user.email)], hashed=True)[0]
+    return comment_json(new_comment, current_user.username, avatar, c_id), 201
+
+
+@blog.route("/category/<int:c_id>/new-post", methods=["GET", "POST"])
 @admin_only
 def new_post(c_id):
-    post_form = CreatePostForm(img_url="Default", date=datetime.datetime.now().strftime("%d/%m/%Y"))
+    post_form = CreatePostForm(img_url="Default", date=datetime.date.today())
     if post_form.validate_on_submit():
         new_post = BlogPost(title=post_form.title.data,
                             subtitle=post_form.subtitle.data,
                             img_url=check_image(post_form.img_url.data),
                             body=post_form.body.data,
                             category_id=c_id,
-                            author=current_user,
-                            date=post_form.date.data)
+                            author_id=current_user.id,
+                            date=datetime.datetime.combine(post_form.date.data, datetime.datetime.now().time()))
 
         db.session.add(new_post)
+        db.session.flush()
+        touch(BlogCategory, c_id, post_count=1)
+        search_index.index_post(db.session, new_post.id)
         db.session.commit()
+        page_cache.invalidate("categories", "feed", f"category:{c_id}")
+        images.schedule("post_images", new_post.img_url)
 
-        return redirect(url_for("view_category", id=c_id))
+        return redirect(url_for("blog.view_category", id=c_id))
     return render_template("new-post.html",
                            variables=VariableManager(edit=False),
                            form=post_form)
 
 
-@app.route("/category/<int:c_id>/edit-post/<int:p_id>", methods=["POST", "GET"])
+@blog.route("/category/<int:c_id>/edit-post/<int:p_id>", methods=["POST", "GET"])
 @admin_only
 def edit_post(c_id, p_id):
     post = db.session.execute(db.select(BlogPost).where(BlogPost.id == p_id)).scalar()
@@ -329,42 +864,97 @@ def edit_post(c_id, p_id):
         post.subtitle=edit_form.subtitle.data
         post.img_url=check_image(edit_form.img_url.data)
         post.body=edit_form.body.data
-        date=edit_form.date.data
+        post.date=datetime.datetime.combine(edit_form.date.data, post.date.time())
+        db.session.flush()
+        touch(BlogCategory, c_id)
+        search_index.index_post(db.session, p_id)
         db.session.commit()
-        return redirect(url_for("view_category", id=c_id))
+        page_cache.invalidate("feed", f"category:{c_id}", f"post:{p_id}")
+        images.schedule("post_images", post.img_url)
+        return redirect(url_for("blog.view_category", id=c_id))
     return render_template("new-post.html",
                            variables=VariableManager(edit=True),
                            form=edit_form)
 
 
-@app.route("/category/<int:c_id>/post/<int:p_id>/delete-comment/<int:comment_id>")
+@blog.route("/category/<int:c_id>/post/<int:p_id>/delete-comment/<int:comment_id>")
 @only_commenter
 def delete_comment(c_id, p_id, comment_id):
     comment_delete = db.get_or_404(Comment, comment_id)
+    # The ids in the URL are not checked against the comment, the rows it belongs to are touched
+    post_id = comment_delete.parent_post_id
+    category_id = db.session.scalar(select(BlogPost.category_id).where(BlogPost.id == post_id))
+    search_index.remove_comments(db.session, [comment_id])
     db.session.delete(comment_delete)
+    db.session.flush()
+    touch(BlogPost, post_id, comment_count=-1)
+    touch(BlogCategory, category_id)
     db.session.commit()
-    return redirect(url_for('view_post', c_id=c_id,p_id=p_id))
+    page_cache.invalidate(f"category:{category_id}", f"post:{post_id}")
+    return redirect(url_for('blog.view_post', c_id=category_id, p_id=post_id))
 
 
-@app.route("/category/<int:c_id>/delete/<int:p_id>")
+@blog.route("/category/<int:c_id>/delete/<int:p_id>")
 @admin_only
 def delete_post(c_id, p_id):
-    post_to_delete = db.get_or_404(BlogPost, p_id)
-    [db.session.delete(comment) for comment in post_to_delete.comments]
-    db.session.delete(post_to_delete)
+    db.first_or_404(select(BlogPost.id).where(BlogPost.id == p_id, BlogPost.category_id == c_id))
+    touch(BlogCategory, c_id, post_count=-delete_posts(BlogPost.id == p_id))
     db.session.commit()
-    return redirect(url_for('view_category', id=c_id))
+    page_cache.invalidate("categories", "feed", f"category:{c_id}", f"post:{p_id}")
+    return redirect(url_for('blog.view_category', id=c_id))
 
 
-@app.route("/about")
+@blog.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    results, total = search_index.search(db.session, query, page=page, per_page=per_page) if query else ([], 0)
+    return render_template("search.html",
+                           variables=VariableManager(),
+                           query=query,
+                           results=results,
+                           total=total,
+                           page=page,
+                           has_next=page * per_page < total)
+
+
+@blog.route("/feed.<any(xml, atom, json):kind>")
+@blog.route("/category/<int:id>/feed.<any(xml, atom, json):kind>")
+@read_replica
+@conditional(feed_version)
+@page_cache.cached(tags=lambda kind, id=None: [f"category:{id}"] if id is not None else ["feed"])
+def feed(kind, id=None):
+    """RSS (feed.xml), Atom (feed.atom) and JSON Feed (feed.json) of all posts or of one category."""
+    if id is None:
+        channel = feeds.Feed(title=current_app.config['FEED_TITLE'],
+                             link=url_for("blog.main_hub", _external=True),
+                             feed_url=url_for("blog.feed", kind=kind, _external=True),
+                             description=f"Newest posts of {current_app.config['FEED_TITLE']}",
+                             updated=db.session.execute(db.select(func.max(BlogCategory.updated_at))).scalar())
+    else:
+        category = db.get_or_404(BlogCategory, id)
+        channel = feeds.Feed(title=category.title,
+                             link=url_for("blog.view_category", id=id, _external=True),
+                             feed_url=url_for("blog.feed", kind=kind, id=id, _external=True),
+                             description=category.subtitle,
+                             updated=category.updated_at)
+    return current_app.response_class(stream_with_context(feeds.generate(kind, channel, feed_entries(id))),
+                                      mimetype=feeds.FORMATS[kind])
+
+
+@blog.route("/about")
+@page_cache.cached()
 def about():
     return render_template("about.html",
                             variables=VariableManager())
 
 
-@app.route("/contact", methods=["GET", "POST"])
+@blog.route("/contact", methods=["GET", "POST"])
+@rate_limiter.limit("contact", "3/hour")
 def contact():
     if request.method == "POST":
+        from web_email import send_email
         response = send_email(name=request.form["name"],
                               email=request.form["email"],
                               phone_number=request.form["phone"],
@@ -378,4 +968,6 @@ def contact():
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    from web_email import mailer
+    mailer.start()
+    create_app().run(debug=True, port=5000)
@@ -0,0 +1,211 @@
+"""
+Request-level performance instrumentation.
+
+Records per-route latency, the number and duration of SQL statements per request
+(SQLAlchemy engine events), template render time and the hit rates of the caches,
+exposes them in the Prometheus text format at /metrics and logs requests exceeding
+SLOW_REQUEST_MS or SLOW_REQUEST_QUERIES together with their statements.
+
+/metrics answers scrapers sending "Authorization: Bearer <METRICS_TOKEN>" and
+requests the authorize callable accepts (e.g. a logged in admin), everyone else
+gets 403.
+
+Values are kept per process; with several gunicorn workers every worker reports
+its own series.
+"""
+import bisect
+import hmac
+import threading
+import time
+from collections import defaultdict
+
+from flask import abort, current_app, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter():
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] += amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram():
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            counts, total = self.series.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[label_values] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    labels = _labels(self.labels + ("le",), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class Metrics():
+    """
+    Flask extension collecting the metrics.
+
+        metrics = Metrics(app, authorize=lambda: current_user.is_authenticated)
+        metrics.add_cache("page", lambda: (page_cache.hits, page_cache.misses))
+    """
+
+    def __init__(self, app=None, authorize=None):
+        """
+        Args: app (Flask): Application to instrument.
+              authorize (callable): Returns True when the current request may read /metrics without the token.
+        """
+        self.authorize = authorize
+        self.requests = Counter("http_requests_total", "Finished requests.", ("endpoint", "method", "status"))
+        self.latency = Histogram("http_request_duration_seconds", "Request latency.", ("endpoint", "method"))
+        self.queries = Histogram("db_queries_per_request", "SQL statements executed per request.",
+                                 ("endpoint",), QUERY_COUNT_BUCKETS)
+        self.query_time = Histogram("db_query_duration_seconds", "Time spent in SQL per request.", ("endpoint",))
+        self.render_time = Histogram("template_render_duration_seconds", "Template render time.", ("template",))
+        self.caches = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SLOW_REQUEST_MS", 500)
+        app.config.setdefault("SLOW_REQUEST_QUERIES", 20)
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.extensions["metrics"] = self
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        # Only the engines of this app are timed, binds included; db.init_app() has to run first
+        if "sqlalchemy" in app.extensions:
+            with app.app_context():
+                for engine in app.extensions["sqlalchemy"].engines.values():
+                    self.instrument(engine)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    @staticmethod
+    def instrument(engine):
+        """Times the statements of an engine, e.g. one created outside Flask-SQLAlchemy."""
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    def add_cache(self, name: str, stats):
+        """
+        Registers a cache whose hit rate is exported.
+        Args: name (str): Label of the cache.
+              stats (callable): Returns a (hits, misses) tuple.
+        """
+        self.caches[name] = stats
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_statements = []
+
+    def _finish_request(self, response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        statements = g.pop("metrics_statements", [])
+        endpoint = request.endpoint or "unknown"
+        query_time = sum(duration for _, duration in statements)
+
+        self.requests.inc(endpoint, request.method, response.status_code)
+        self.latency.observe(elapsed, endpoint, request.method)
+        self.queries.observe(len(statements), endpoint)
+        self.query_time.observe(query_time, endpoint)
+
+        config = current_app.config
+        if elapsed * 1000 > config["SLOW_REQUEST_MS"] or len(statements) > config["SLOW_REQUEST_QUERIES"]:
+            details = "\n".join(f"  {duration * 1000:.1f} ms  {' '.join(statement.split())[:500]}"
+                                for statement, duration in statements)
+            current_app.logger.warning("Slow request %s %s: %.1f ms, %d queries (%.1f ms)\n%s",
+                                       request.method, request.full_path, elapsed * 1000,
+                                       len(statements), query_time * 1000, details)
+        return response
+
+    def _start_render(self, app, template, context, **extra):
+        if has_request_context():
+            g.setdefault("metrics_renders", []).append(time.perf_counter())
+
+    def _finish_render(self, app, template, context, **extra):
+        starts = g.get("metrics_renders") if has_request_context() else None
+        if starts:
+            self.render_time.observe(time.perf_counter() - starts.pop(), template.name or "string")
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.requests, self.latency, self.queries, self.query_time, self.render_time):
+            lines.extend(metric.render())
+        stats = {name: stats() for name, stats in sorted(self.caches.items())}
+        families = (("cache_hits_total", "counter", "Lookups answered from the cache.", lambda hits, misses: hits),
+                    ("cache_misses_total", "counter", "Lookups that missed the cache.", lambda hits, misses: misses),
+                    ("cache_hit_ratio", "gauge", "Share of lookups answered from the cache.",
+                     lambda hits, misses: hits / (hits + misses) if hits + misses else 0))
+        for name, kind, description, value in families:
+            lines.extend((f"# HELP {name} {description}", f"# TYPE {name} {kind}"))
+            lines.extend(f'{name}{{cache="{cache}"}} {value(*counts)}' for cache, counts in stats.items())
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        token = current_app.config["METRICS_TOKEN"]
+        scraper = bool(token) and hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"),
+                                                      f"Bearer {token}".encode("utf-8"))
+        if not scraper and (self.authorize is None or not self.authorize()):
+            abort(403)
+        return current_app.response_class(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    starts = connection.info.get("metrics_query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    if has_request_context() and "metrics_statements" in g:
+        g.metrics_statements.append((statement, duration))
@@ -0,0 +1,39 @@
+"""Tables as they were first created by db.create_all()."""
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, Text
+
+metadata = MetaData()
+
+Table("users", metadata,
+      Column("id", Integer, primary_key=True),
+      Column("username", String(100), nullable=False),
+      Column("password", String(100), nullable=False),
+      Column("email", String(250), unique=True, nullable=False))
+
+Table("blog_categories", metadata,
+      Column("id", Integer, primary_key=True),
+      Column("title", String(250), unique=True, nullable=False),
+      Column("subtitle", String(250), nullable=False),
+      Column("img_url", String(250), nullable=False),
+      Column("author_id", Integer, ForeignKey("users.id")))
+
+Table("blog_posts", metadata,
+      Column("id", Integer, primary_key=True),
+      Column("title", String(250), unique=True, nullable=False),
+      Column("subtitle", String(250), nullable=False),
+      Column("body", Text, nullable=False),
+      Column("img_url", String(250), nullable=False),
+      Column("date", String(250), nullable=False),
+      Column("author_id", Integer, ForeignKey("users.id")),
+      Column("category_id", Integer, ForeignKey("blog_categories.id")))
+
+Table("comments", metadata,
+      Column("id", Integer, primary_key=True),
+      Column("text", Text, nullable=False),
+      Column("author_id", Integer, ForeignKey("users.id")),
+      Column("parent_post_id", Integer, ForeignKey("blog_posts.id")),
+      Column("posted_time", Text, nullable=False))
+
+
+def upgrade(connection):
+    # Databases created before migrations existed already have these tables
+    metadata.create_all(connection, checkfirst=True)
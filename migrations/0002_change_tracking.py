@@ -0,0 +1,28 @@
+"""updated_at on categories and posts, users.email_hash and room for longer password hashes."""
+import datetime
+import hashlib
+
+from sqlalchemy import Column, DateTime, String, bindparam, text
+
+from migrations.ops import add_column, has_column, set_not_null
+
+
+def upgrade(connection):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    for table in ("blog_categories", "blog_posts"):
+        if not has_column(connection, table, "updated_at"):
+            add_column(connection, table, Column("updated_at", DateTime))
+            connection.execute(text(f"UPDATE {table} SET updated_at = :now")
+                               .bindparams(bindparam("now", type_=DateTime)), {"now": now})
+            set_not_null(connection, table, "updated_at")
+
+    if not has_column(connection, "users", "email_hash"):
+        add_column(connection, "users", Column("email_hash", String(32)))
+        users = connection.execute(text("SELECT id, email FROM users")).all()
+        if users:
+            connection.execute(text("UPDATE users SET email_hash = :hash WHERE id = :id"),
+                               [{"id": id, "hash": hashlib.md5(email.encode("utf-8")).hexdigest()}
+                                for id, email in users])
+
+    if connection.dialect.name != "sqlite":
+        connection.execute(text("ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(255)"))
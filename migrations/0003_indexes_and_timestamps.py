@@ -0,0 +1,64 @@
+"""
+Indexes on the foreign keys used by every page and real timestamps for
+blog_posts.date and comments.posted_time, which were stored as "dd/mm/YYYY" strings.
+"""
+import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, bindparam, text
+
+from migrations.ops import add_column, column_type, create_index, set_not_null
+
+metadata = MetaData()
+blog_categories = Table("blog_categories", metadata, Column("author_id", Integer))
+blog_posts = Table("blog_posts", metadata,
+                   Column("category_id", Integer), Column("author_id", Integer), Column("date", DateTime))
+comments = Table("comments", metadata, Column("parent_post_id", Integer), Column("author_id", Integer))
+
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f")
+BATCH_SIZE = 1000
+
+
+def parse_date(value):
+    """Parses the old string dates, unreadable values fall back to the migration time."""
+    if isinstance(value, datetime.datetime):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime((value or "").strip(), date_format)
+        except ValueError:
+            continue
+    return datetime.datetime.now()
+
+
+def to_timestamp(connection, table: str, column: str):
+    """Replaces a string column by a DateTime column of the same name."""
+    if isinstance(column_type(connection, table, column), DateTime):
+        return
+
+    temporary = f"{column}_ts"
+    add_column(connection, table, Column(temporary, DateTime))
+    last_id = 0
+    while True:
+        rows = connection.execute(text(f"SELECT id, {column} FROM {table} WHERE id > :last_id "
+                                       f"ORDER BY id LIMIT {BATCH_SIZE}"), {"last_id": last_id}).all()
+        if not rows:
+            break
+        connection.execute(text(f"UPDATE {table} SET {temporary} = :value WHERE id = :id")
+                           .bindparams(bindparam("value", type_=DateTime)),
+                           [{"id": id, "value": parse_date(value)} for id, value in rows])
+        last_id = rows[-1][0]
+    connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    connection.execute(text(f"ALTER TABLE {table} RENAME COLUMN {temporary} TO {column}"))
+    set_not_null(connection, table, column)
+
+
+def upgrade(connection):
+    to_timestamp(connection, "blog_posts", "date")
+    to_timestamp(connection, "comments", "posted_time")
+
+    create_index(connection, blog_categories, "ix_blog_categories_author_id", "author_id")
+    create_index(connection, blog_posts, "ix_blog_posts_category_id", "category_id")
+    create_index(connection, blog_posts, "ix_blog_posts_author_id", "author_id")
+    create_index(connection, blog_posts, "ix_blog_posts_date", "date")
+    create_index(connection, comments, "ix_comments_parent_post_id", "parent_post_id")
+    create_index(connection, comments, "ix_comments_author_id", "author_id")
@@ -0,0 +1,6 @@
+"""Full-text index over posts and comments, filled from the existing rows."""
+import search_index
+
+
+def upgrade(connection):
+    search_index.rebuild(connection)
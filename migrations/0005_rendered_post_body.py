@@ -0,0 +1,28 @@
+"""Stores the sanitized HTML and a plain text excerpt of every post next to its source."""
+from sqlalchemy import Column, String, Text, text
+
+from html_utils import html_to_text, make_excerpt, sanitize_html
+from migrations.ops import add_column, has_column, set_not_null
+
+BATCH_SIZE = 200
+
+
+def upgrade(connection):
+    if has_column(connection, "blog_posts", "body_html"):
+        return
+    add_column(connection, "blog_posts", Column("body_html", Text))
+    add_column(connection, "blog_posts", Column("excerpt", String(300)))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(text("SELECT id, body FROM blog_posts WHERE id > :last_id "
+                                       f"ORDER BY id LIMIT {BATCH_SIZE}"), {"last_id": last_id}).all()
+        if not rows:
+            break
+        connection.execute(text("UPDATE blog_posts SET body_html = :body_html, excerpt = :excerpt WHERE id = :id"),
+                           [{"id": id, "body_html": sanitize_html(body), "excerpt": make_excerpt(html_to_text(body))}
+                            for id, body in rows])
+        last_id = rows[-1][0]
+
+    set_not_null(connection, "blog_posts", "body_html")
+    set_not_null(connection, "blog_posts", "excerpt")
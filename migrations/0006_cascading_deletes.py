@@ -0,0 +1,12 @@
+"""
+ON DELETE CASCADE on the foreign keys from comments to blog_posts and from
+blog_posts to blog_categories, so deleting a category or post removes its children
+in the database.
+"""
+from migrations.ops import set_foreign_key_ondelete
+
+
+def upgrade(connection):
+    # Posts first: rebuilding a table on SQLite deletes its rows, which must not cascade yet
+    set_foreign_key_ondelete(connection, "blog_posts", "category_id", "CASCADE")
+    set_foreign_key_ondelete(connection, "comments", "parent_post_id", "CASCADE")
@@ -0,0 +1,18 @@
+"""blog_categories.post_count and blog_posts.comment_count, filled from the current rows."""
+from sqlalchemy import Column, Integer, text
+
+from migrations.ops import add_column, set_not_null
+
+COUNTERS = (("blog_categories", "post_count", "SELECT COUNT(*) FROM blog_posts "
+                                              "WHERE blog_posts.category_id = blog_categories.id"),
+            ("blog_posts", "comment_count", "SELECT COUNT(*) FROM comments "
+                                            "WHERE comments.parent_post_id = blog_posts.id"))
+
+
+def upgrade(connection):
+    for table, column, count in COUNTERS:
+        add_column(connection, table, Column(column, Integer))
+        connection.execute(text(f"UPDATE {table} SET {column} = ({count})"))
+        set_not_null(connection, table, column)
+        if connection.dialect.name != "sqlite":
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT 0"))
@@ -0,0 +1,27 @@
+"""Sanitizes the stored comments, new ones are sanitized by add_comment() before they are written."""
+import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+from html_utils import sanitize_comment
+
+BATCH_SIZE = 500
+
+
+def upgrade(connection):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    last_id = 0
+    while True:
+        rows = connection.execute(text("SELECT id, text, parent_post_id FROM comments WHERE id > :last_id "
+                                       f"ORDER BY id LIMIT {BATCH_SIZE}"), {"last_id": last_id}).all()
+        if not rows:
+            break
+        changed = [{"id": id, "text": sanitize_comment(comment), "post_id": post_id} for id, comment, post_id in rows
+                   if sanitize_comment(comment) != comment]
+        if changed:
+            connection.execute(text("UPDATE comments SET text = :text WHERE id = :id"), changed)
+            # New validators for the pages showing the rewritten comments
+            connection.execute(text("UPDATE blog_posts SET updated_at = :now WHERE id = :id")
+                               .bindparams(bindparam("now", type_=DateTime)),
+                               [{"id": post_id, "now": now} for post_id in {row["post_id"] for row in changed}])
+        last_id = rows[-1][0]
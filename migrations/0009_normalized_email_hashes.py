@@ -0,0 +1,12 @@
+"""users.email_hash computed from the trimmed, lowercased email, as Gravatar expects it."""
+import hashlib
+
+from sqlalchemy import text
+
+
+def upgrade(connection):
+    users = connection.execute(text("SELECT id, email FROM users")).all()
+    if users:
+        connection.execute(text("UPDATE users SET email_hash = :hash WHERE id = :id"),
+                           [{"id": id, "hash": hashlib.md5(email.strip().lower().encode("utf-8")).hexdigest()}
+                            for id, email in users])
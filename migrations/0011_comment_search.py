@@ -0,0 +1,9 @@
+"""Indexes every comment as a document of its own, post_search loses its comments column."""
+from sqlalchemy import text
+
+import search_index
+
+
+def upgrade(connection):
+    connection.execute(text("DROP TABLE IF EXISTS post_search"))
+    search_index.rebuild(connection)
@@ -0,0 +1,66 @@
+"""
+Schema migrations for the blog database.
+
+Every module in this package named "<number>_<description>.py" defines an
+upgrade(connection) function. Migrations run in order, each in its own
+transaction, and applied versions are recorded in the schema_migrations table.
+They are applied out-of-band with:
+
+    flask --app main migrate
+"""
+import datetime
+import importlib
+import pkgutil
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, insert, select
+
+metadata = MetaData()
+schema_migrations = Table("schema_migrations", metadata,
+                          Column("version", String(100), primary_key=True),
+                          Column("applied_at", DateTime, nullable=False))
+
+
+def available() -> list:
+    """Returns the names of all migration modules, oldest first."""
+    return sorted(module.name for module in pkgutil.iter_modules(__path__) if module.name[:1].isdigit())
+
+
+def applied(engine) -> set:
+    metadata.create_all(engine, tables=[schema_migrations])
+    with engine.connect() as connection:
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine) -> list:
+    done = applied(engine)
+    return [name for name in available() if name not in done]
+
+
+def upgrade(engine) -> list:
+    """
+    Applies every pending migration.
+    Args: engine: SQLAlchemy engine of the blog database.
+    Returns: list: Names of the migrations that were applied.
+    """
+    names = pending(engine)
+    for name in names:
+        module = importlib.import_module(f"{__name__}.{name}")
+        with engine.connect() as connection:
+            sqlite = connection.dialect.name == "sqlite"
+            if sqlite:
+                # Table rebuilds must not fire foreign key actions; SQLite only changes
+                # enforcement outside a transaction and checks the result explicitly instead
+                connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+                connection.commit()
+            try:
+                with connection.begin():
+                    module.upgrade(connection)
+                    if sqlite and connection.exec_driver_sql("PRAGMA foreign_key_check").first():
+                        raise RuntimeError(f"{name} left rows violating foreign keys")
+                    connection.execute(insert(schema_migrations).values(version=name,
+                                                                        applied_at=datetime.datetime.now()))
+            finally:
+                if sqlite:
+                    connection.exec_driver_sql("PRAGMA foreign_keys = ON")
+                    connection.commit()
+    return names
@@ -0,0 +1,86 @@
+"""Idempotent schema operations shared by the migrations."""
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex, Index
+
+
+def has_table(connection, table: str) -> bool:
+    return inspect(connection).has_table(table)
+
+
+def has_column(connection, table: str, column: str) -> bool:
+    return column in {info["name"] for info in inspect(connection).get_columns(table)}
+
+
+def column_type(connection, table: str, column: str):
+    """Returns the reflected type of a column, or None when the column does not exist."""
+    for info in inspect(connection).get_columns(table):
+        if info["name"] == column:
+            return info["type"]
+    return None
+
+
+def has_index(connection, table: str, name: str) -> bool:
+    return name in {info["name"] for info in inspect(connection).get_indexes(table)}
+
+
+def add_column(connection, table: str, column):
+    """Adds a sqlalchemy Column to an existing table unless it is already there."""
+    if has_column(connection, table, column.name):
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+
+def create_index(connection, table, name: str, *columns):
+    """Creates an index on columns of a Core Table unless it already exists."""
+    if has_index(connection, table.name, name):
+        return
+    connection.execute(CreateIndex(Index(name, *(table.c[column] for column in columns))))
+
+
+def set_not_null(connection, table: str, column: str):
+    """SQLite cannot alter column constraints in place, there the column stays nullable."""
+    if connection.dialect.name != "sqlite":
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+
+
+def set_foreign_key_ondelete(connection, table: str, column: str, ondelete: str):
+    """
+    Sets the ON DELETE action of the foreign key on a column. SQLite cannot alter
+    constraints, there the table is recreated from its stored definition, which
+    relies on upgrade() running the migration with foreign key enforcement off.
+    """
+    foreign_key = next((info for info in inspect(connection).get_foreign_keys(table)
+                        if info["constrained_columns"] == [column]), None)
+    if foreign_key is None or (foreign_key.get("options") or {}).get("ondelete", "").upper() == ondelete.upper():
+        return
+    referred = f"{foreign_key['referred_table']} ({', '.join(foreign_key['referred_columns'])})"
+
+    if connection.dialect.name != "sqlite":
+        name = foreign_key["name"]
+        connection.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+        connection.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+                                f"REFERENCES {referred} ON DELETE {ondelete}"))
+        return
+
+    definition = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {"name": table}).scalar_one()
+    pattern = re.compile(r'(FOREIGN KEY\s*\(\s*"?%s"?\s*\)\s*REFERENCES\s*"?%s"?\s*\([^)]*\))'
+                         r'(\s+ON DELETE\s+(SET NULL|SET DEFAULT|CASCADE|RESTRICT|NO ACTION))?'
+                         % (re.escape(column), re.escape(foreign_key["referred_table"])), re.IGNORECASE)
+    definition, found = pattern.subn(lambda match: f"{match.group(1)} ON DELETE {ondelete}", definition, count=1)
+    if not found:
+        raise RuntimeError(f"Foreign key {table}.{column} not found in the table definition")
+    indexes = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name "
+                                      "AND sql IS NOT NULL"), {"name": table}).scalars().all()
+
+    temporary = f"_{table}_rebuild"
+    connection.execute(text(re.sub(r'^CREATE TABLE\s+"?%s"?' % re.escape(table), f"CREATE TABLE {temporary}",
+                                   definition, flags=re.IGNORECASE)))
+    connection.execute(text(f"INSERT INTO {temporary} SELECT * FROM {table}"))
+    connection.execute(text(f"DROP TABLE {table}"))
+    connection.execute(text(f"ALTER TABLE {temporary} RENAME TO {table}"))
+    for index in indexes:
+        connection.execute(text(index))
@@ -0,0 +1,318 @@
+"""
+Server-side cache for rendered pages.
+
+Entries are keyed by endpoint, view arguments, query string and auth state and
+carry a set of tags (e.g. "category:3"). Write routes call invalidate() with the
+tags they touched, which bumps a version counter per tag; an entry is only served
+while the versions it was rendered under are still current, so a page rendered
+concurrently with a write is never served afterwards. Streamed responses are
+stored once their last chunk was sent.
+
+Two backends store the pages:
+    MemoryBackend  - in-process LRU, the default
+    SQLiteBackend  - a local SQLite file shared by every gunicorn worker
+                     (PAGE_CACHE_URL = "sqlite:////path/to/cache.db")
+
+The tag versions always live where every worker sees them, so a write handled by
+one worker invalidates the pages cached in memory by all others. CACHE_TAGS_URL
+defaults to the SQLite file of PAGE_CACHE_URL, or to cache-tags.db in the
+instance folder; "memory" keeps them per process, for a single-process server.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, g, request, make_response
+from flask_login import current_user
+
+
+class MemoryBackend():
+    """In-process LRU store bounded by entry count, entries expire after their TTL."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _connect(local: threading.local, path: str) -> sqlite3.Connection:
+    """Per-thread connection to a SQLite file shared between processes."""
+    connection = getattr(local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        local.connection = connection
+    return connection
+
+
+class SQLiteBackend():
+    """LRU store in a local SQLite file, shared between worker processes on one host."""
+
+    def __init__(self, path: str, max_entries: int = 512):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS page_cache "
+                               "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_page_cache_accessed ON page_cache (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        return _connect(self._local, self.path)
+
+    def get(self, key: str):
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute("SELECT value FROM page_cache WHERE key = ? AND expires >= ?",
+                                 (key, now)).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE page_cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value, ttl: int):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("INSERT OR REPLACE INTO page_cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                           (key, pickle.dumps(value), now + ttl, now))
+        connection.execute("DELETE FROM page_cache WHERE expires < ? OR key IN "
+                           "(SELECT key FROM page_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                           (now, self.max_entries))
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM page_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM page_cache")
+
+
+class MemoryTags():
+    """Tag versions of one process."""
+
+    def __init__(self):
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def tag_versions(self, tags) -> tuple:
+        with self._lock:
+            return tuple(self._tags.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+
+class SQLiteTags():
+    """Tag versions in a local SQLite file, a bump is seen by every worker process on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("CREATE TABLE IF NOT EXISTS cache_tags "
+                                   "(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        return _connect(self._local, self.path)
+
+    def tag_versions(self, tags) -> tuple:
+        if not tags:
+            return ()
+        rows = self._connection().execute(
+            "SELECT tag, version FROM cache_tags WHERE tag IN (%s)" % ",".join("?" * len(tags)),
+            tuple(tags)).fetchall()
+        versions = dict(rows)
+        return tuple(versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        connection = self._connection()
+        for tag in tags:
+            connection.execute("INSERT INTO cache_tags (tag, version) VALUES (?, 1) "
+                               "ON CONFLICT(tag) DO UPDATE SET version = version + 1", (tag,))
+
+
+def make_backend(url: str, max_entries: int):
+    """
+    Creates a cache backend from a PAGE_CACHE_URL value.
+    Args: url (str): "memory" (or empty) or "sqlite:///<path>".
+          max_entries (int): Upper bound of stored pages.
+    Returns: The backend instance.
+    """
+    if not url or url == "memory":
+        return MemoryBackend(max_entries=max_entries)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(path=url[len("sqlite:///"):], max_entries=max_entries)
+    raise ValueError(f"Unsupported PAGE_CACHE_URL: {url}")
+
+
+def make_tags(url: str):
+    """
+    Creates a tag version store from a CACHE_TAGS_URL value.
+    Args: url (str): "memory" or "sqlite:///<path>".
+    Returns: The store instance.
+    """
+    if url == "memory":
+        return MemoryTags()
+    if url.startswith("sqlite:///"):
+        return SQLiteTags(path=url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported CACHE_TAGS_URL: {url}")
+
+
+def tags_url(app) -> str:
+    """CACHE_TAGS_URL of an application, by default a SQLite file every worker opens."""
+    if app.config.get("CACHE_TAGS_URL"):
+        return app.config["CACHE_TAGS_URL"]
+    if app.config.get("PAGE_CACHE_URL", "").startswith("sqlite:///"):
+        return app.config["PAGE_CACHE_URL"]
+    os.makedirs(app.instance_path, exist_ok=True)
+    return "sqlite:///" + os.path.join(app.instance_path, "cache-tags.db")
+
+
+# Stores of one application, kept in app.extensions["page_cache"]
+PageCacheState = namedtuple("PageCacheState", "backend tags")
+
+
+class PageCache():
+    """
+    Flask extension caching full rendered responses of GET routes. The stores
+    belong to each application, the hit counters to the process.
+
+        page_cache = PageCache(app)
+
+        @app.route("/category/<int:id>")
+        @page_cache.cached(tags=lambda id: [f"category:{id}"])
+        def view_category(id): ...
+
+        page_cache.invalidate(f"category:{id}")
+    """
+
+    def __init__(self, app=None):
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PAGE_CACHE_ENABLED", True)
+        app.config.setdefault("PAGE_CACHE_URL", "memory")
+        app.config.setdefault("PAGE_CACHE_MAX_ENTRIES", 512)
+        app.config.setdefault("PAGE_CACHE_TTL", 300)
+        app.config.setdefault("CACHE_TAGS_URL", None)
+        app.extensions["page_cache"] = PageCacheState(
+            backend=make_backend(app.config["PAGE_CACHE_URL"], app.config["PAGE_CACHE_MAX_ENTRIES"]),
+            tags=make_tags(tags_url(app)))
+
+    @staticmethod
+    def state() -> PageCacheState:
+        return current_app.extensions["page_cache"]
+
+    @staticmethod
+    def auth_state() -> str:
+        """Returns the part of the cache key describing who is looking at the page."""
+        if current_user.is_authenticated:
+            return f"user:{current_user.id}"
+        return "anon"
+
+    def make_key(self) -> str:
+        args = ",".join(f"{name}={value}" for name, value in sorted(request.view_args.items()))
+        return f"{request.endpoint}|{args}|{request.query_string.decode()}|{self.auth_state()}"
+
+    def cached(self, tags=None, anonymous_only: bool = False):
+        """
+        Decorator caching the response of a view.
+        Args: tags (callable): Receives the view arguments and returns the tags of the page.
+              anonymous_only (bool): Only cache the page for visitors that are not logged in,
+                                     for pages that render per-session data such as CSRF tokens.
+        """
+        def decorator(function):
+            @wraps(function)
+            def decorated_function(*args, **kwargs):
+                if (not current_app.config["PAGE_CACHE_ENABLED"]
+                        or request.method not in ("GET", "HEAD")
+                        or (anonymous_only and current_user.is_authenticated)):
+                    return function(*args, **kwargs)
+
+                # "*" is bumped by clear(), which drops the pages of every worker at once
+                page_tags = ("*",) + (tuple(tags(**kwargs)) if tags else ())
+                state = self.state()
+                versions = state.tags.tag_versions(page_tags)
+                key = self.make_key()
+                entry = state.backend.get(key)
+                if entry is not None and entry[0] == versions:
+                    self.hits += 1
+                    _, status, mimetype, body = entry
+                    response = current_app.response_class(body, status=status, mimetype=mimetype)
+                    response.headers["X-Page-Cache"] = "HIT"
+                    return response
+
+                self.misses += 1
+                response = make_response(function(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    # Views may shorten the lifetime of their page through g.page_cache_max_ttl
+                    ttl = min(current_app.config["PAGE_CACHE_TTL"],
+                              g.get("page_cache_max_ttl", current_app.config["PAGE_CACHE_TTL"]))
+                    entry = (versions, response.status_code, response.mimetype)
+                    if response.is_streamed:
+                        response.response = self._record(state.backend, response.response, key, entry, ttl)
+                    else:
+                        state.backend.set(key, entry + (response.get_data(),), ttl)
+                response.headers["X-Page-Cache"] = "MISS"
+                return response
+            return decorated_function
+        return decorator
+
+    @staticmethod
+    def _record(backend, chunks, key: str, entry: tuple, ttl: int):
+        """Passes a streamed body through and stores it once it was sent completely."""
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        backend.set(key, entry + (b"".join(parts),), ttl)
+
+    def invalidate(self, *tags):
+        """Marks every page carrying one of the tags as stale."""
+        if tags:
+            self.state().tags.bump(tags)
+
+    def clear(self):
+        """Invalidates every cached page."""
+        state = self.state()
+        state.tags.bump(("*",))
+        state.backend.clear()
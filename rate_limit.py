@@ -0,0 +1,206 @@
+"""
+Token bucket rate limiting of the expensive form posts.
+
+Every limited view has a bucket per client IP and, for logged in users, one per
+user id; a request takes a token from each and is answered with 429 and a
+Retry-After header when one of them is empty. The check runs before the view, so
+rejected requests never reach the database, the password hashing or the mailer.
+Client IPs are taken from request.remote_addr, behind a reverse proxy wrap the
+application in werkzeug's ProxyFix.
+
+Limits are written as "<tokens>/<period>" where the period is second, minute,
+hour or a number of seconds, e.g. "5/minute" or "20/300", and are overridden per
+view through RATE_LIMIT_<NAME> (RATE_LIMIT_LOGIN = "10/minute").
+
+Two backends are available:
+    MemoryBackend  - buckets of one process, the default
+    SQLiteBackend  - a local SQLite file shared by every gunicorn worker
+                     (RATE_LIMIT_URL = "sqlite:////path/to/limits.db")
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+def parse_rate(rate: str) -> tuple:
+    """
+    Args: rate (str): "<tokens>/<period>".
+    Returns: tuple: (capacity, tokens refilled per second).
+    """
+    tokens, _, period = rate.partition("/")
+    seconds = PERIODS[period] if period in PERIODS else float(period)
+    return int(tokens), int(tokens) / seconds
+
+
+def _refill(bucket, capacity: int, refill: float, now: float) -> float:
+    if bucket is None:
+        return capacity
+    tokens, updated = bucket
+    return min(capacity, tokens + (now - updated) * refill)
+
+
+def _wait(tokens: float, refill: float) -> float:
+    return 0.0 if tokens >= 1 else (1 - tokens) / refill
+
+
+class MemoryBackend():
+    """Buckets of one process, the least recently used are forgotten beyond max_entries."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, keys, capacity: int, refill: float) -> float:
+        """
+        Takes one token from every bucket, or none when one of them is empty.
+        Returns: float: 0 when the tokens were taken, otherwise seconds until they are available.
+        """
+        now = time.time()
+        with self._lock:
+            levels = [_refill(self._buckets.get(key), capacity, refill, now) for key in keys]
+            wait = max(_wait(tokens, refill) for tokens in levels)
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+                self._buckets.move_to_end(key)
+            # A forgotten bucket starts full again, which only errs towards letting clients through
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend():
+    """Buckets in a local SQLite file, shared between worker processes on one host."""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS rate_limit "
+                           "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_updated ON rate_limit (updated)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def take(self, keys, capacity: int, refill: float) -> float:
+        connection = self._connection()
+        now = time.time()
+        # The write lock is taken up front so two workers cannot spend the same token
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT key, tokens, updated FROM rate_limit WHERE key IN (%s)" % ",".join("?" * len(keys)),
+                tuple(keys)).fetchall()
+            buckets = {key: (tokens, updated) for key, tokens, updated in rows}
+            levels = [_refill(buckets.get(key), capacity, refill, now) for key in keys]
+            wait = max(_wait(tokens, refill) for tokens in levels)
+            connection.executemany("INSERT OR REPLACE INTO rate_limit (key, tokens, updated) VALUES (?, ?, ?)",
+                                   [(key, tokens - 1 if not wait else tokens, now)
+                                    for key, tokens in zip(keys, levels)])
+            connection.execute("DELETE FROM rate_limit WHERE key IN "
+                               "(SELECT key FROM rate_limit ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                               (self.max_entries,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limit")
+
+
+def make_backend(url: str, max_entries: int):
+    """
+    Creates a bucket store from a RATE_LIMIT_URL value.
+    Args: url (str): "memory" (or empty) or "sqlite:///<path>".
+          max_entries (int): Upper bound of stored buckets.
+    Returns: The backend instance.
+    """
+    if not url or url == "memory":
+        return MemoryBackend(max_entries=max_entries)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(path=url[len("sqlite:///"):], max_entries=max_entries)
+    raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+
+
+class RateLimiter():
+    """
+    Flask extension limiting how often a client may call a view. The bucket store
+    of each application is kept in app.extensions["rate_limiter"].
+
+        rate_limiter = RateLimiter(app)
+
+        @app.route("/login", methods=["GET", "POST"])
+        @rate_limiter.limit("login", "10/minute")
+        def login(): ...
+    """
+
+    def __init__(self, app=None):
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATE_LIMIT_ENABLED", True)
+        app.config.setdefault("RATE_LIMIT_URL", "memory")
+        app.config.setdefault("RATE_LIMIT_MAX_ENTRIES", 10000)
+        app.extensions["rate_limiter"] = make_backend(app.config["RATE_LIMIT_URL"],
+                                                      app.config["RATE_LIMIT_MAX_ENTRIES"])
+
+    @staticmethod
+    def backend():
+        return current_app.extensions["rate_limiter"]
+
+    @staticmethod
+    def client_keys(name: str) -> list:
+        """Bucket keys of the current request, read from the session cookie without loading the user."""
+        keys = [f"{name}|ip:{request.remote_addr}"]
+        user_id = session.get("_user_id")
+        if user_id is not None:
+            keys.append(f"{name}|user:{user_id}")
+        return keys
+
+    def limit(self, name: str, rate: str, methods=("POST",)):
+        """
+        Decorator rate limiting a view.
+        Args: name (str): Name of the limit, RATE_LIMIT_<NAME> overrides the rate.
+              rate (str): Default rate, "<tokens>/<period>".
+              methods (tuple): Request methods that take a token, the others pass freely.
+        """
+        def decorator(function):
+            @wraps(function)
+            def decorated_function(*args, **kwargs):
+                if not current_app.config["RATE_LIMIT_ENABLED"] or request.method not in methods:
+                    return function(*args, **kwargs)
+                capacity, refill = parse_rate(current_app.config.get(f"RATE_LIMIT_{name.upper()}", rate))
+                wait = self.backend().take(self.client_keys(name), capacity, refill)
+                if wait:
+                    self.rejected += 1
+                    raise TooManyRequests(retry_after=math.ceil(wait))
+                return function(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+    def clear(self):
+        self.backend().clear()
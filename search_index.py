@@ -0,0 +1,219 @@
+"""
+Full-text search over blog posts and their comments.
+
+Posts and comments are separate documents: SQLite keeps them in two FTS5 virtual
+tables keyed by the post and comment ids, PostgreSQL in two tables with a
+weighted tsvector and a GIN index each. A new comment is one insert and a
+deleted one one delete, the post's document is only written when the post
+changes. Other databases fall back to a LIKE scan of the titles. The write
+routes keep the index current through index_post(), index_comment(),
+remove_comments() and remove_posts(); rebuild() recreates it from scratch.
+"""
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+
+from html_utils import html_to_text
+
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+
+
+def _dialect(executor) -> str:
+    """Dialect name of a Session or Connection."""
+    bind = executor.get_bind() if hasattr(executor, "get_bind") else executor
+    return bind.dialect.name
+
+
+def create_schema(executor):
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        executor.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS post_search "
+                              "USING fts5(title, subtitle, body, tokenize = 'porter unicode61')"))
+        executor.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS comment_search "
+                              "USING fts5(body, post_id UNINDEXED, tokenize = 'porter unicode61')"))
+    elif dialect == "postgresql":
+        executor.execute(text("CREATE TABLE IF NOT EXISTS post_search ("
+                              "post_id INTEGER PRIMARY KEY, body_text TEXT NOT NULL, document TSVECTOR NOT NULL)"))
+        executor.execute(text("CREATE INDEX IF NOT EXISTS ix_post_search_document ON post_search USING GIN (document)"))
+        executor.execute(text("CREATE TABLE IF NOT EXISTS comment_search ("
+                              "comment_id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL, document TSVECTOR NOT NULL)"))
+        executor.execute(text("CREATE INDEX IF NOT EXISTS ix_comment_search_document "
+                              "ON comment_search USING GIN (document)"))
+
+
+def _document(executor, post_id: int):
+    """Reads the searchable text of a post, or None if the post does not exist."""
+    post = executor.execute(text("SELECT title, subtitle, body FROM blog_posts WHERE id = :id"),
+                            {"id": post_id}).first()
+    if post is None:
+        return None
+    return {"id": post_id, "title": post.title, "subtitle": post.subtitle, "body": html_to_text(post.body)}
+
+
+def index_post(executor, post_id: int):
+    """
+    Adds or refreshes the title, subtitle and body of one post, call it before committing the write.
+    Args: executor: db.session or a Connection.
+          post_id (int): The post that changed.
+    """
+    document = _document(executor, post_id)
+    if document is None:
+        return remove_posts(executor, [post_id])
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        executor.execute(text("DELETE FROM post_search WHERE rowid = :id"), {"id": post_id})
+        executor.execute(text("INSERT INTO post_search (rowid, title, subtitle, body) "
+                              "VALUES (:id, :title, :subtitle, :body)"), document)
+    elif dialect == "postgresql":
+        executor.execute(text("INSERT INTO post_search (post_id, body_text, document) VALUES (:id, :body, "
+                              "setweight(to_tsvector('english', :title), 'A') || "
+                              "setweight(to_tsvector('english', :subtitle), 'B') || "
+                              "setweight(to_tsvector('english', :body), 'C')) "
+                              "ON CONFLICT (post_id) DO UPDATE SET "
+                              "body_text = EXCLUDED.body_text, document = EXCLUDED.document"), document)
+
+
+def index_comment(executor, comment_id: int):
+    """
+    Adds one new comment to the index, its post's document is left alone.
+    Args: executor: db.session or a Connection.
+          comment_id (int): The inserted comment.
+    """
+    comment = executor.execute(text("SELECT id, parent_post_id AS post_id, text FROM comments WHERE id = :id"),
+                               {"id": comment_id}).mappings().first()
+    if comment is None:
+        return
+    document = {"id": comment["id"], "post_id": comment["post_id"], "body": html_to_text(comment["text"])}
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        executor.execute(text("INSERT INTO comment_search (rowid, body, post_id) VALUES (:id, :body, :post_id)"),
+                         document)
+    elif dialect == "postgresql":
+        executor.execute(text("INSERT INTO comment_search (comment_id, post_id, document) VALUES (:id, :post_id, "
+                              "setweight(to_tsvector('english', :body), 'D')) "
+                              "ON CONFLICT (comment_id) DO NOTHING"), document)
+
+
+def remove_comments(executor, comment_ids):
+    comment_ids = list(comment_ids)
+    if not comment_ids:
+        return
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        executor.execute(text("DELETE FROM comment_search WHERE rowid = :id"), [{"id": id} for id in comment_ids])
+    elif dialect == "postgresql":
+        executor.execute(text("DELETE FROM comment_search WHERE comment_id = :id"),
+                         [{"id": id} for id in comment_ids])
+
+
+def remove_posts(executor, post_ids):
+    """Removes posts and their comments from the index, call it before the comment rows are deleted."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        executor.execute(text("DELETE FROM post_search WHERE rowid = :id"), [{"id": id} for id in post_ids])
+    elif dialect == "postgresql":
+        executor.execute(text("DELETE FROM post_search WHERE post_id = :id"), [{"id": id} for id in post_ids])
+    else:
+        return
+    comment_ids = executor.execute(text("SELECT id FROM comments WHERE parent_post_id IN :ids")
+                                   .bindparams(bindparam("ids", expanding=True)), {"ids": post_ids}).scalars()
+    remove_comments(executor, comment_ids)
+
+
+def rebuild(executor) -> int:
+    """
+    Recreates the whole index from blog_posts and comments.
+    Returns: int: Number of indexed posts.
+    """
+    if _dialect(executor) not in ("sqlite", "postgresql"):
+        return 0
+    create_schema(executor)
+    executor.execute(text("DELETE FROM post_search"))
+    executor.execute(text("DELETE FROM comment_search"))
+    post_ids = executor.execute(text("SELECT id FROM blog_posts ORDER BY id")).scalars().all()
+    for post_id in post_ids:
+        index_post(executor, post_id)
+    for comment_id in executor.execute(text("SELECT id FROM comments ORDER BY id")).scalars().all():
+        index_comment(executor, comment_id)
+    return len(post_ids)
+
+
+def _fts_query(query: str) -> str:
+    """Turns user input into an FTS5 query matching every word, the last one as a prefix."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _snippet(raw: str) -> Markup:
+    """Escapes a snippet and turns the match markers into <mark> tags."""
+    return Markup(str(escape(raw or "")).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>"))
+
+
+def search(executor, query: str, page: int = 1, per_page: int = 10) -> tuple:
+    """
+    Ranked full-text search.
+    Args: executor: db.session or a Connection.
+          query (str): What the reader typed.
+          page (int): 1-based result page.
+    Returns: tuple: (results, total), results are dicts with id, category_id, title, subtitle and snippet.
+    """
+    offset = (max(page, 1) - 1) * per_page
+    dialect = _dialect(executor)
+    if dialect == "sqlite":
+        match = _fts_query(query)
+        if not match:
+            return [], 0
+        total = executor.execute(text("SELECT count(*) FROM ("
+                                      "SELECT rowid FROM post_search WHERE post_search MATCH :match UNION "
+                                      "SELECT post_id FROM comment_search WHERE comment_search MATCH :match)"),
+                                 {"match": match}).scalar()
+        # A post ranks by its best hit, a comment weighing half of a body match. SQLite takes the
+        # bare snippet column from the row holding min(rank)
+        rows = executor.execute(text(
+            "WITH hits AS ("
+            "SELECT rowid AS post_id, bm25(post_search, 10.0, 5.0, 1.0) AS rank, "
+            "snippet(post_search, 2, :start, :end, '…', 16) AS snippet "
+            "FROM post_search WHERE post_search MATCH :match "
+            "UNION ALL "
+            "SELECT post_id, 0.5 * bm25(comment_search), snippet(comment_search, 0, :start, :end, '…', 16) "
+            "FROM comment_search WHERE comment_search MATCH :match), "
+            "best AS (SELECT post_id, min(rank) AS rank, snippet FROM hits GROUP BY post_id) "
+            "SELECT p.id, p.category_id, p.title, p.subtitle, best.snippet "
+            "FROM best JOIN blog_posts p ON p.id = best.post_id "
+            "ORDER BY best.rank LIMIT :limit OFFSET :offset"),
+            {"match": match, "start": SNIPPET_START, "end": SNIPPET_END,
+             "limit": per_page, "offset": offset}).mappings().all()
+    elif dialect == "postgresql":
+        if not query.strip():
+            return [], 0
+        hits = ("WITH q AS (SELECT websearch_to_tsquery('english', :query) AS q), hits AS ("
+                "SELECT s.post_id, ts_rank(s.document, q.q) AS rank FROM post_search s, q WHERE s.document @@ q.q "
+                "UNION ALL "
+                "SELECT c.post_id, ts_rank(c.document, q.q) FROM comment_search c, q WHERE c.document @@ q.q) ")
+        total = executor.execute(text(hits + "SELECT count(DISTINCT post_id) FROM hits"), {"query": query}).scalar()
+        rows = executor.execute(text(
+            hits + "SELECT p.id, p.category_id, p.title, p.subtitle, "
+            "ts_headline('english', s.body_text, q.q, :options) AS snippet "
+            "FROM (SELECT post_id, max(rank) AS rank FROM hits GROUP BY post_id) best "
+            "JOIN blog_posts p ON p.id = best.post_id JOIN post_search s ON s.post_id = best.post_id, q "
+            "ORDER BY best.rank DESC LIMIT :limit OFFSET :offset"),
+            {"query": query, "limit": per_page, "offset": offset,
+             "options": f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=30, MinWords=10"}
+        ).mappings().all()
+    else:
+        pattern = f"%{query.strip()}%"
+        total = executor.execute(text("SELECT count(*) FROM blog_posts WHERE title LIKE :p OR subtitle LIKE :p"),
+                                 {"p": pattern}).scalar()
+        rows = executor.execute(text("SELECT id, category_id, title, subtitle, '' AS snippet FROM blog_posts "
+                                     "WHERE title LIKE :p OR subtitle LIKE :p ORDER BY id DESC "
+                                     "LIMIT :limit OFFSET :offset"),
+                                {"p": pattern, "limit": per_page, "offset": offset}).mappings().all()
+    return [dict(row, snippet=_snippet(row["snippet"])) for row in rows], total
@@ -0,0 +1,88 @@
+// Posts comments and loads further pages through the comments API instead of reloading the post
+window.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('comments');
+    if (!container) {
+        return;
+    }
+    const list = document.getElementById('comment-list');
+    const count = document.getElementById('comment-count');
+    const more = document.getElementById('more-comments');
+    const wrapper = document.getElementById('comment-form');
+    const form = wrapper ? wrapper.querySelector('form') : null;
+    const api = container.dataset.api;
+    let next = container.dataset.next;
+
+    function renderComment(comment) {
+        const item = document.createElement('li');
+        item.className = 'd-flex align-items-start mb-3';
+        item.innerHTML =
+            '<div class="commenterImage me-3"><img class="rounded-circle" /></div>' +
+            '<div class="commentContent flex-grow-1">' +
+            '<div class="commentText"><p class="mb-1"></p></div>' +
+            '<div class="commentFooter d-flex justify-content-between align-items-center mt-2">' +
+            '<span class="authorName text-muted"></span>' +
+            '<span class="commentDate fw-bold"></span></div></div>';
+        item.querySelector('img').src = comment.avatar;
+        // The API returns the text as sanitized HTML, as the page renders it
+        item.querySelector('.commentText p').innerHTML = comment.text;
+        item.querySelector('.authorName').textContent = comment.author;
+        item.querySelector('.commentDate').textContent =
+            comment.posted_time.slice(0, 10).split('-').reverse().join('/');
+        if (comment.delete_url) {
+            const remove = document.createElement('a');
+            remove.href = comment.delete_url;
+            remove.className = 'ms-2 text-danger text-decoration-none';
+            remove.textContent = 'Delete Comment';
+            item.querySelector('.authorName').after(remove);
+        }
+        list.appendChild(item);
+    }
+
+    function setCount(value) {
+        count.dataset.count = value;
+        count.textContent = value + ' comment' + (value === 1 ? '' : 's');
+    }
+
+    if (more) {
+        more.addEventListener('click', (event) => {
+            event.preventDefault();
+            fetch(api + '?after=' + encodeURIComponent(next), {headers: {'Accept': 'application/json'}})
+                .then((response) => response.ok ? response.json() : Promise.reject(response))
+                .then((page) => {
+                    page.comments.forEach(renderComment);
+                    next = page.next;
+                    if (next === null) {
+                        more.remove();
+                    }
+                })
+                .catch(() => { window.location = more.href; });
+        });
+    }
+
+    if (form) {
+        form.addEventListener('submit', (event) => {
+            event.preventDefault();
+            const field = form.querySelector('[name="body"]');
+            const token = form.querySelector('[name="csrf_token"]');
+            fetch(api, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json', 'X-CSRFToken': token ? token.value : ''},
+                body: JSON.stringify({body: field.value})
+            })
+                .then((response) => response.json().then((data) => ({ok: response.ok, data: data})))
+                .then((result) => {
+                    if (!result.ok) {
+                        alert(result.data.error);
+                        return;
+                    }
+                    // Comments are listed oldest first, the new one belongs after the last page
+                    if (!next) {
+                        renderComment(result.data);
+                    }
+                    setCount(parseInt(count.dataset.count, 10) + 1);
+                    field.value = '';
+                })
+                .catch(() => form.submit());
+        });
+    }
+});
@@ -0,0 +1,203 @@
+"""
+Static export of the public pages, for serving the blog from a plain web server.
+
+    flask --app main export build/site --base-url https://blog.example.com
+
+The main hub, every category page with its older pages, every post, the about
+page and the feeds are rendered through their views as an anonymous visitor, in
+a pool of worker processes. Post pages are exported read-only, without the comment
+form, and with every comment on one page. A page "/category/3" is written to
+"category/3/index.html", so the web server needs e.g. nginx's
+"try_files $uri $uri/index.html"; every other path (login, search, contact, the
+comment API) is meant to be proxied to the application.
+
+The version of every page is kept in the output directory. Later runs only
+render the pages whose rows changed, remove the pages of deleted rows, and
+render everything again when a template, the static assets or the page size
+changed.
+"""
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from assets import _write_atomic
+
+STATE_FILE = ".export-state.json"
+# Configuration of the applications rendering the pages
+EXPORT_CONFIG = {"STATIC_EXPORT": True,
+                 "COMMENTS_PER_PAGE": 0,
+                 "PAGE_CACHE_ENABLED": False,
+                 "RATE_LIMIT_ENABLED": False,
+                 "ASSETS_BUILD_ON_STARTUP": False,
+                 "IMAGES_BUILD_ON_STARTUP": False,
+                 "MAIL_DELIVERY_ON_STARTUP": False}
+
+Page = namedtuple("Page", "path version")
+Result = namedtuple("Result", "rendered removed unchanged failed")
+
+
+def output_file(path: str) -> str:
+    """Maps a URL path to the file it is exported to, relative to the output directory."""
+    path = path.strip("/")
+    if os.path.splitext(path)[1]:
+        return path
+    return os.path.join(path, "index.html") if path else "index.html"
+
+
+def site_pages() -> list:
+    """
+    Lists every exported page with the version of the rows it is rendered from.
+    A handful of queries cover the whole site, a page needs rendering when its version changed.
+    Returns: list: Page tuples.
+    """
+    from flask import current_app, url_for
+    from main import db, BlogCategory, BlogPost
+
+    per_page = current_app.config['POSTS_PER_PAGE']
+    categories = db.session.execute(db.select(BlogCategory.id, BlogCategory.updated_at)
+                                    .order_by(BlogCategory.id)).all()
+    posts = db.session.execute(db.select(BlogPost.id, BlogPost.category_id, BlogPost.updated_at)
+                               .order_by(BlogPost.category_id, BlogPost.id.desc())).all()
+
+    newest = max((updated_at for _, updated_at in categories), default=None)
+    site = f"{len(categories)}:{newest.isoformat() if newest else ''}"
+    pages = [Page(url_for("blog.main_hub"), f"index:{site}"),
+             Page(url_for("blog.about"), "about")]
+    pages += [Page(url_for("blog.feed", kind=kind), f"feed:{site}") for kind in ("xml", "atom", "json")]
+
+    post_ids = {}
+    for id, category_id, updated_at in posts:
+        post_ids.setdefault(category_id, []).append(id)
+        pages.append(Page(url_for("blog.view_post", c_id=category_id, p_id=id), f"post:{updated_at.isoformat()}"))
+    for id, updated_at in categories:
+        # Every post change touches its category, so all pages of a category share its version
+        version = f"category:{updated_at.isoformat()}"
+        pages.append(Page(url_for("blog.view_category", id=id), version))
+        pages += [Page(url_for("blog.feed", id=id, kind=kind), version) for kind in ("xml", "atom", "json")]
+        # The cursor of a page is the id of the last post on the page before it
+        ids = post_ids.get(id, [])
+        pages += [Page(url_for("blog.view_category", id=id, before=ids[index - 1]), version)
+                  for index in range(per_page, len(ids), per_page)]
+    return pages
+
+
+def site_version(app) -> str:
+    """Hash of everything besides the rows that changes the rendered pages."""
+    digest = hashlib.sha256(json.dumps([app.config['POSTS_PER_PAGE'], EXPORT_CONFIG]).encode("utf-8"))
+    for name in sorted(app.jinja_env.list_templates()):
+        digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode("utf-8"))
+    digest.update(json.dumps(app.extensions["assets"].manifest, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_state(output: str) -> dict:
+    try:
+        with open(os.path.join(output, STATE_FILE), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"site": None, "pages": {}}
+
+
+def _copy_if_changed(source: str, target: str):
+    """copytree() copy function skipping files that were already copied."""
+    if os.path.exists(target):
+        source_stat, target_stat = os.stat(source), os.stat(target)
+        if source_stat.st_size == target_stat.st_size and source_stat.st_mtime <= target_stat.st_mtime:
+            return target
+    return shutil.copy2(source, target)
+
+
+def _remove(output: str, path: str):
+    file = os.path.join(output, output_file(path))
+    if os.path.exists(file):
+        os.remove(file)
+    # Drops the directories left empty, up to the output directory
+    directory = os.path.dirname(file)
+    while os.path.abspath(directory) != os.path.abspath(output) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+
+_client = None
+_base_url = None
+
+
+def _start_worker(base_url: str):
+    """Builds an application of its own in every process of the pool."""
+    global _client, _base_url
+    import main
+    _client = main.create_app(EXPORT_CONFIG).test_client()
+    _base_url = base_url
+
+
+def _render(output: str, paths: list) -> list:
+    """
+    Renders a batch of pages into the output directory.
+    Returns: list: (path, status code) pairs.
+    """
+    results = []
+    for path in paths:
+        response = _client.get(path, base_url=_base_url)
+        if response.status_code == 200:
+            _write_atomic(os.path.join(output, output_file(path)), response.get_data())
+        results.append((path, response.status_code))
+        response.close()
+    return results
+
+
+def export(output: str, base_url: str, processes: int = None, full: bool = False,
+           batch_size: int = 50) -> Result:
+    """
+    Exports the site, runs in an application context.
+    Args: output (str): Target directory, created when missing.
+          base_url (str): Public URL of the site, used for the absolute links of the feeds.
+          processes (int): Size of the process pool, defaults to the number of CPUs.
+          full (bool): Render every page even when its version did not change.
+          batch_size (int): Pages rendered per task of the pool.
+    Returns: Result: Numbers of rendered, removed and unchanged pages and the failed (path, status) pairs.
+    """
+    from flask import current_app
+    from main import db
+
+    app = current_app._get_current_object()
+    os.makedirs(output, exist_ok=True)
+    previous = load_state(output)
+    site = site_version(app)
+    state = {"site": site, "pages": {}}
+    # url_for() needs a request, the pages are linked relative to the site root
+    with app.test_request_context(base_url=base_url):
+        pages = site_pages()
+    versions = {page.path: page.version for page in pages}
+    if not full and previous["site"] == site:
+        state["pages"] = {path: version for path, version in previous["pages"].items() if path in versions}
+    stale = [page.path for page in pages if state["pages"].get(page.path) != page.version]
+    removed = [path for path in previous["pages"] if path not in versions]
+    for path in removed:
+        _remove(output, path)
+
+    shutil.copytree(app.static_folder, os.path.join(output, "static"), copy_function=_copy_if_changed,
+                    dirs_exist_ok=True)
+
+    # The forked workers open connections of their own, none may be shared with this process
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+
+    failed = []
+    if stale:
+        batches = [stale[start:start + batch_size] for start in range(0, len(stale), batch_size)]
+        with ProcessPoolExecutor(max_workers=processes, initializer=_start_worker, initargs=(base_url,)) as pool:
+            for results in pool.map(_render, [output] * len(batches), batches):
+                for path, status in results:
+                    if status == 200:
+                        state["pages"][path] = versions[path]
+                    else:
+                        failed.append((path, status))
+
+    # Failed pages keep no version, so the next run tries them again
+    _write_atomic(os.path.join(output, STATE_FILE), json.dumps(state, indent=1, sort_keys=True).encode("utf-8"))
+    return Result(rendered=len(stale) - len(failed), removed=len(removed),
+                  unchanged=len(pages) - len(stale), failed=failed)
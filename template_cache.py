@@ -0,0 +1,107 @@
+"""
+Faster template loading and rendering.
+
+Compiled templates are kept on disk by Jinja's FileSystemBytecodeCache, so a new
+gunicorn worker loads them without parsing and compiling the sources again;
+"flask compile-templates" fills the cache during deploy.
+
+Parts of a page that are the same for every visitor are wrapped in a cache tag
+and rendered once per key:
+
+    {% cache "header-nav", variables.current_user.is_authenticated %}
+        ...
+    {% endcache %}
+
+The key is built from every expression of the tag. Fragments are rendered fresh
+while templates auto reload (debug mode), so template edits show up immediately.
+"""
+import os
+from collections import namedtuple
+
+import click
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from page_cache import MemoryBackend
+
+# Fragment store of one application, kept in app.extensions["template_cache"]
+TemplateCacheState = namedtuple("TemplateCacheState", "backend ttl")
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension implementing the {% cache key, ... %} ... {% endcache %} tag."""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts: list, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or self.environment.auto_reload:
+            return caller()
+        state = cache.state()
+        key = "|".join(str(part) for part in parts)
+        fragment = state.backend.get(key)
+        if fragment is None:
+            cache.misses += 1
+            fragment = caller()
+            state.backend.set(key, fragment, state.ttl)
+        else:
+            cache.hits += 1
+        return fragment
+
+
+class TemplateCache():
+    """
+    Flask extension enabling the bytecode cache and the fragment cache of the templates.
+    The fragments belong to each application, the hit counters to the process.
+    """
+
+    def __init__(self, app=None):
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("TEMPLATE_BYTECODE_CACHE", True)
+        app.config.setdefault("TEMPLATE_BYTECODE_CACHE_DIR", None)  # a per-user directory in the system temp dir
+        app.config.setdefault("FRAGMENT_CACHE_TTL", 3600)
+        app.config.setdefault("FRAGMENT_CACHE_MAX_ENTRIES", 64)
+        app.extensions["template_cache"] = TemplateCacheState(
+            backend=MemoryBackend(max_entries=app.config["FRAGMENT_CACHE_MAX_ENTRIES"]),
+            ttl=app.config["FRAGMENT_CACHE_TTL"])
+
+        if app.config["TEMPLATE_BYTECODE_CACHE"]:
+            directory = app.config["TEMPLATE_BYTECODE_CACHE_DIR"]
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+        @app.cli.command("compile-templates")
+        def compile_templates_command():
+            """Compile every template into the bytecode cache."""
+            names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".html"))
+            for name in names:
+                app.jinja_env.get_template(name)
+            click.echo(f"Compiled {len(names)} templates")
+
+    @staticmethod
+    def state() -> TemplateCacheState:
+        return current_app.extensions["template_cache"]
+
+    def clear(self):
+        self.state().backend.clear()
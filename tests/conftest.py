@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+
+import migrations
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The blog on a migrated SQLite database of its own, with its caches in the temporary directory."""
+    import main
+
+    app = main.create_app({"TESTING": True,
+                           "SECRET_KEY": "test",
+                           "WTF_CSRF_ENABLED": False,
+                           "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'blog.db'}",
+                           "SQLALCHEMY_BINDS": {},
+                           "CACHE_TAGS_URL": f"sqlite:///{tmp_path / 'cache-tags.db'}",
+                           "TEMPLATE_BYTECODE_CACHE_DIR": str(tmp_path / "templates"),
+                           "ASSETS_BUILD_ON_STARTUP": False,
+                           "IMAGES_BUILD_ON_STARTUP": False,
+                           "MAIL_DELIVERY_ON_STARTUP": False})
+    with app.app_context():
+        migrations.upgrade(main.db.engine)
+    yield app
+    with app.app_context():
+        main.db.session.remove()
+        for engine in main.db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def blog(app):
+    """An admin and a commenter, one category with one post."""
+    import main
+
+    now = datetime.datetime(2024, 6, 24, 12, 0)
+    with app.app_context():
+        session = main.db.session
+        session.add_all([main.User(id=1, username="admin", password="x", email="admin@example.com",
+                                   email_hash=main.avatar_hash("admin@example.com")),
+                         main.User(id=2, username="eva", password="x", email="eva@example.com",
+                                   email_hash=main.avatar_hash("eva@example.com"))])
+        session.add(main.BlogCategory(id=1, title="Python", subtitle="Snakes", img_url="python.jpg", author_id=1,
+                                      post_count=1))
+        session.add(main.BlogPost(id=1, title="First", subtitle="Hello", body="<p>Hello <b>world</b></p>",
+                                  img_url="coding-bg.jpg", author_id=1, category_id=1, date=now))
+        session.flush()
+        main.search_index.index_post(session, 1)
+        session.commit()
+    return {"category": 1, "post": 1, "admin": 1, "commenter": 2}
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def log_in():
+    """Logs a test client in as a user, without going through the login form."""
+    def log_in(client, user_id: int):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+    return log_in
@@ -0,0 +1,65 @@
+import os
+
+from flask import Flask, url_for
+
+from assets import Assets
+
+
+def make_app(static, **config) -> Flask:
+    app = Flask(__name__, static_folder=str(static), static_url_path="/static")
+    app.config.update(ETAG_SALT="salt", **config)
+    Assets(app)
+    return app
+
+
+def write(path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_only_stylesheets_and_scripts_are_fingerprinted(tmp_path):
+    write(tmp_path / "css" / "styles.css", "body {}")
+    write(tmp_path / "js" / "scripts.js", "run()")
+    write(tmp_path / "img" / "logo.png", "png")
+    write(tmp_path / "img" / "derived" / "post_images" / "a-480.css", "not a source")
+
+    app = make_app(tmp_path)
+    assert app.extensions["assets"].manifest == {}
+    manifest, pruned = Assets().build(app)
+    assert sorted(manifest) == ["css/styles.css", "js/scripts.js"]
+    assert app.extensions["assets"].manifest == manifest
+    assert os.path.isfile(tmp_path / (manifest["css/styles.css"] + ".gz"))
+    with app.test_request_context():
+        assert url_for("static", filename="css/styles.css") == "/static/" + manifest["css/styles.css"]
+        assert url_for("static", filename="img/logo.png") == "/static/img/logo.png"
+
+
+def test_rebuilding_prunes_the_previous_outputs(tmp_path):
+    write(tmp_path / "css" / "styles.css", "body {}")
+    write(tmp_path / "css" / "old.css", "p {}")
+    app = make_app(tmp_path)
+    first, _ = Assets().build(app)
+
+    write(tmp_path / "css" / "styles.css", "body { margin: 0 }")
+    os.remove(tmp_path / "css" / "old.css")
+    second, pruned = Assets().build(app)
+
+    assert pruned == 4
+    assert not os.path.exists(tmp_path / first["css/styles.css"])
+    assert not os.path.exists(tmp_path / (first["css/styles.css"] + ".gz"))
+    files = sorted(path.relative_to(tmp_path / "dist").as_posix() for path in (tmp_path / "dist").rglob("*"))
+    assert files == ["css", second["css/styles.css"][len("dist/"):], second["css/styles.css"][len("dist/"):] + ".gz",
+                     "manifest.json"]
+
+
+def test_a_new_build_changes_the_etag_salt(tmp_path):
+    write(tmp_path / "css" / "styles.css", "body {}")
+    app = make_app(tmp_path, ASSETS_BUILD_ON_STARTUP=True)
+    first = app.config["ETAG_SALT"]
+    assert first.startswith("salt|")
+
+    write(tmp_path / "css" / "styles.css", "body { margin: 0 }")
+    Assets().build(app)
+    assert app.config["ETAG_SALT"] not in ("salt", first)
+    # Workers loading the manifest written at deploy time agree on the salt
+    assert make_app(tmp_path).config["ETAG_SALT"] == app.config["ETAG_SALT"]
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+import main
+
+
+@pytest.fixture
+def posts(app, blog):
+    """Post 1 of the blog fixture plus posts 2 to 7 in category 1, and one post in category 2."""
+    app.config["POSTS_PER_PAGE"] = 3
+    with app.app_context():
+        session = main.db.session
+        session.add(main.BlogCategory(id=2, title="Rust", subtitle="Crabs", img_url="rust.jpg", author_id=1))
+        for id in range(2, 9):
+            session.add(main.BlogPost(id=id, title=f"Post {id}", subtitle="Sub", body=f"<p>Body {id}</p>",
+                                      img_url="coding-bg.jpg", author_id=1 if id % 2 else 2,
+                                      category_id=2 if id == 8 else 1, date=datetime.datetime(2024, 7, id)))
+        session.commit()
+
+
+def page(app, **kwargs) -> tuple:
+    with app.test_request_context():
+        posts, next_cursor = main.category_page(category_id=1, **kwargs)
+        return [post.id for post in posts], next_cursor
+
+
+def test_pages_are_newest_first_and_cut_at_the_cursor(app, posts):
+    assert page(app) == ([7, 6, 5], 5)
+    assert page(app, before=5) == ([4, 3, 2], 2)
+    assert page(app, before=2) == ([1], None)
+    # A cursor of a deleted post still continues below it
+    assert page(app, before=6) == ([5, 4, 3], 3)
+
+
+def test_full_last_page_has_no_cursor(app, posts):
+    app.config["POSTS_PER_PAGE"] = 7
+    assert page(app) == ([7, 6, 5, 4, 3, 2, 1], None)
+
+
+def test_authors_are_loaded_with_the_posts(app, posts):
+    statements = []
+    with app.app_context():
+        event.listen(main.db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        with app.test_request_context():
+            posts, _ = main.category_page(category_id=1)
+            assert [post.author.username for post in posts] == ["admin", "eva", "admin"]
+            # The editor source is never read for a preview
+            assert all("body" not in post.__dict__ for post in posts)
+    assert len(statements) == 1
+
+
+def test_pager_links_follow_the_cursor(client, posts):
+    first = client.get("/category/1").text
+    assert "Post 7" in first and "Post 4" not in first
+    assert "/category/1/before/5" in first
+    assert "Newest Posts" not in first
+
+    last = client.get("/category/1/before/2").text
+    assert "Post 8" not in last
+    assert ">First<" in last
+    assert "Older Posts" not in last
+    assert "Newest Posts" in last
+
+
+def test_cursor_is_accepted_as_query_parameter(client, posts):
+    assert client.get("/category/1?before=5").text == client.get("/category/1/before/5").text
+    # Anything but a post id shows the first page
+    assert "Post 7" in client.get("/category/1?before=newest").text
@@ -0,0 +1,54 @@
+import pytest
+
+import main
+
+
+def comment_texts(app) -> list:
+    with app.app_context():
+        return main.db.session.scalars(main.select(main.Comment.text).order_by(main.Comment.id)).all()
+
+
+@pytest.mark.parametrize("body, stored", [
+    ("1 < 2 & more", "1 &lt; 2 &amp; more"),
+    ("<b>bold</b> <i>it</i> <em>em</em> <code>x = 1</code><br>", "<b>bold</b> <i>it</i> <em>em</em> <code>x = 1</code><br>"),
+    ('<b class="x" style="color: red" onclick="alert(1)">Hi</b>', "<b>Hi</b>"),
+    ('<img src="https://tracker.example/pixel.gif">Hello', "Hello"),
+    ('<a href="https://spam.example" target="_blank">cheap</a>', "cheap"),
+    ("<script>alert(1)</script><style>body {}</style>ok", "ok"),
+])
+def test_comments_keep_only_inline_formatting(client, blog, log_in, body, stored):
+    log_in(client, blog["commenter"])
+    response = client.post("/api/category/1/post/1/comments", json={"body": body})
+    assert response.status_code == 201
+    assert response.json["text"] == stored
+    assert comment_texts(client.application) == [stored]
+
+
+def test_form_and_api_render_the_stored_comment(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    client.post("/category/1/post/1", data={"body": '<b>Hi</b><img src=x onerror="alert(1)">'})
+    assert comment_texts(client.application) == ["<b>Hi</b>"]
+
+    page = client.get("/category/1/post/1").text
+    assert '<p class="mb-1"><b>Hi</b></p>' in page
+    assert "onerror" not in page
+    assert client.get("/api/category/1/post/1/comments").json["comments"][0]["text"] == "<b>Hi</b>"
+
+
+def test_comments_api_pages_after_the_cursor(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    for number in range(5):
+        client.post("/api/category/1/post/1/comments", json={"body": f"Comment {number}"})
+
+    page = client.get("/api/category/1/post/1/comments?limit=2").json
+    assert [comment["text"] for comment in page["comments"]] == ["Comment 0", "Comment 1"]
+    page = client.get(f"/api/category/1/post/1/comments?limit=2&after={page['next']}").json
+    assert [comment["text"] for comment in page["comments"]] == ["Comment 2", "Comment 3"]
+    page = client.get(f"/api/category/1/post/1/comments?limit=2&after={page['next']}").json
+    assert [comment["text"] for comment in page["comments"]] == ["Comment 4"]
+    assert page["next"] is None
+
+
+def test_anonymous_visitors_cannot_comment(client, blog):
+    assert client.post("/api/category/1/post/1/comments", json={"body": "Hi"}).status_code == 401
+    assert comment_texts(client.application) == []
@@ -0,0 +1,39 @@
+import main
+
+
+def counters(app) -> tuple:
+    with app.app_context():
+        return (main.db.session.get(main.BlogCategory, 1).post_count,
+                main.db.session.get(main.BlogPost, 1).comment_count)
+
+
+def test_comments_move_the_post_counter(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    client.post("/api/category/1/post/1/comments", json={"body": "One"})
+    client.post("/api/category/1/post/1/comments", json={"body": "Two"})
+    assert counters(client.application)[1] == 2
+
+
+def test_deleting_a_comment_uses_the_rows_it_belongs_to(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    client.post("/api/category/1/post/1/comments", json={"body": "Nice"})
+
+    # The ids in the URL point elsewhere, the counters of the comment's own post change
+    response = client.get("/category/7/post/9/delete-comment/1")
+    assert response.status_code == 302
+    assert response.location.endswith("/category/1/post/1")
+    assert counters(client.application)[1] == 0
+    with client.application.app_context():
+        assert main.db.session.scalars(main.select(main.Comment)).all() == []
+
+
+def test_reconcile_counts_repairs_drifted_counters(app, blog):
+    with app.app_context():
+        main.db.session.execute(main.update(main.BlogCategory).values(post_count=5))
+        main.db.session.execute(main.update(main.BlogPost).values(comment_count=3))
+        main.db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["reconcile-counts"])
+    assert result.exit_code == 0, result.output
+    assert "Corrected 1 categories and 1 posts" in result.output
+    assert counters(app) == (1, 0)
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, func, select, text
+
+import main
+import migrations
+from db_routing import enable_sqlite_foreign_keys
+
+
+def counts(app) -> dict:
+    with app.app_context():
+        session = main.db.session
+        return {"categories": session.scalar(select(func.count()).select_from(main.BlogCategory)),
+                "posts": session.scalar(select(func.count()).select_from(main.BlogPost)),
+                "comments": session.scalar(select(func.count()).select_from(main.Comment)),
+                "search": session.execute(text("SELECT COUNT(*) FROM post_search")).scalar(),
+                "comment search": session.execute(text("SELECT COUNT(*) FROM comment_search")).scalar()}
+
+
+@pytest.fixture
+def commented(client, blog, log_in):
+    """The blog fixture with two comments, logged in as the admin."""
+    log_in(client, blog["commenter"])
+    for body in ("First!", "Second"):
+        client.post("/api/category/1/post/1/comments", json={"body": body})
+    log_in(client, blog["admin"])
+    return blog
+
+
+def test_deleting_a_post_removes_its_comments_and_search_row(client, commented):
+    assert counts(client.application) == {"categories": 1, "posts": 1, "comments": 2, "search": 1,
+                                          "comment search": 2}
+    assert client.get("/category/1/delete/1").status_code == 302
+    assert counts(client.application) == {"categories": 1, "posts": 0, "comments": 0, "search": 0,
+                                          "comment search": 0}
+    with client.application.app_context():
+        assert main.db.session.get(main.BlogCategory, 1).post_count == 0
+
+
+def test_deleting_a_category_removes_everything_below_it(client, commented):
+    assert client.get("/delete/category/1").status_code == 302
+    assert counts(client.application) == {"categories": 0, "posts": 0, "comments": 0, "search": 0,
+                                          "comment search": 0}
+    assert client.get("/category/1").status_code == 404
+
+
+def test_post_of_another_category_is_not_deleted(client, commented):
+    assert client.get("/category/2/delete/1").status_code == 404
+    assert counts(client.application)["posts"] == 1
+
+
+def test_database_cascades_category_deletes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blog.db'}")
+    migrations.upgrade(engine)
+    enable_sqlite_foreign_keys(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (id, username, password, email) VALUES (1, 'a', 'x', 'a@a.cz')"))
+        connection.execute(text("INSERT INTO blog_categories (id, title, subtitle, img_url, author_id, updated_at) "
+                                "VALUES (1, 'C', 's', 'c.jpg', 1, '2024-01-01')"))
+        connection.execute(text("INSERT INTO blog_posts (id, title, subtitle, body, body_html, excerpt, img_url, "
+                                "author_id, category_id, date, updated_at) "
+                                "VALUES (1, 'P', 's', 'b', 'b', 'b', 'p.jpg', 1, 1, '2024-01-01', '2024-01-01')"))
+        connection.execute(text("INSERT INTO comments (id, text, author_id, parent_post_id, posted_time) "
+                                "VALUES (1, 'hi', 1, 1, '2024-01-01')"))
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM blog_categories WHERE id = 1"))
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT COUNT(*) FROM blog_posts")) == 0
+        assert connection.scalar(text("SELECT COUNT(*) FROM comments")) == 0
+    engine.dispose()
@@ -0,0 +1,41 @@
+def test_unchanged_page_is_answered_with_304(client, blog):
+    response = client.get("/category/1")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/category/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+
+
+def test_if_modified_since_is_honoured_for_anonymous_visitors(client, blog):
+    last_modified = client.get("/category/1").headers["Last-Modified"]
+    assert client.get("/category/1", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+
+def test_changed_rows_give_a_new_etag(client, blog, log_in):
+    etag = client.get("/category/1/post/1").headers["ETag"]
+
+    commenter = client.application.test_client()
+    log_in(commenter, blog["commenter"])
+    commenter.post("/api/category/1/post/1/comments", json={"body": "Nice"})
+
+    response = client.get("/category/1/post/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_missing_rows_are_not_validated(client, blog):
+    assert client.get("/category/42", headers={"If-None-Match": '"anything"'}).status_code == 404
+
+
+def test_post_pages_of_logged_in_users_are_never_revalidated(client, blog, log_in):
+    # The comment form carries a CSRF token of the session, a cached copy must not be reused
+    log_in(client, blog["commenter"])
+    response = client.get("/category/1/post/1")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+    response = client.get("/category/1/post/1", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
@@ -0,0 +1,56 @@
+from flask import Flask
+
+from images import ResponsiveImages
+
+
+def make_app(static) -> Flask:
+    app = Flask(__name__, static_folder=str(static), static_url_path="/static")
+    app.config.update(IMAGES_BUILD_ON_STARTUP=False)
+    ResponsiveImages(app)
+    return app
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+def test_originals_are_used_until_variants_exist(tmp_path):
+    touch(tmp_path / "img" / "post_images" / "sea.jpg")
+    app = make_app(tmp_path)
+    images = app.extensions["images"]
+    with app.test_request_context():
+        assert str(images.responsive_image("post_images", "sea.jpg")) == \
+            '<img class="" src="/static/img/post_images/sea.jpg" alt="" loading="lazy">'
+        assert "image-set" not in images.masthead_css("post_images", "sea.jpg")
+
+
+def test_variants_written_by_another_process_are_served(tmp_path):
+    touch(tmp_path / "img" / "post_images" / "sea.jpg")
+    app = make_app(tmp_path)
+    images = app.extensions["images"]
+    # Written after the application started, e.g. by "flask build-images"
+    for name in ("sea-480.webp", "sea-960.webp", "sea-480.jpg", "sea-960.jpg"):
+        touch(tmp_path / "img" / "derived" / "post_images" / name)
+
+    with app.test_request_context():
+        assert images.variants("post_images", "sea.jpg") == {
+            "image/webp": [(480, "img/derived/post_images/sea-480.webp"),
+                           (960, "img/derived/post_images/sea-960.webp")],
+            "image/jpeg": [(480, "img/derived/post_images/sea-480.jpg"), (960, "img/derived/post_images/sea-960.jpg")],
+        }
+        picture = str(images.responsive_image("post_images", "sea.jpg"))
+        css = str(images.masthead_css("post_images", "sea.jpg"))
+    assert ('<source type="image/webp" srcset="/static/img/derived/post_images/sea-480.webp 480w, '
+            '/static/img/derived/post_images/sea-960.webp 960w"') in picture
+    assert 'srcset="/static/img/derived/post_images/sea-480.jpg 480w' in picture
+    assert "@media (min-width: 481px) and (max-width: 960px)" in css
+
+
+def test_names_outside_the_image_folders_have_no_variants(tmp_path):
+    touch(tmp_path / "img" / "derived" / "post_images" / "main-480.jpg")
+    app = make_app(tmp_path)
+    images = app.extensions["images"]
+    with app.app_context():
+        assert images.variants("post_images", "../../main.py") == {}
+        assert images.variants("templates", "main.py") == {}
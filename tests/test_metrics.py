@@ -0,0 +1,24 @@
+from sqlalchemy import create_engine, event, text
+
+import main
+from metrics import _before_cursor_execute
+
+
+def test_only_the_apps_engines_are_timed(app):
+    with app.app_context():
+        assert event.contains(main.db.engine, "before_cursor_execute", _before_cursor_execute)
+    other = create_engine("sqlite://")
+    with other.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert not event.contains(other, "before_cursor_execute", _before_cursor_execute)
+
+
+def test_statements_are_counted_per_request(app, blog):
+    # The histogram belongs to the process-wide extension, earlier tests add to it too
+    histogram = main.metrics.queries.series
+    counts, total = histogram.get(("blog.view_category",), ([0], 0.0))
+    before = sum(counts)
+    app.test_client().get("/category/1")
+    new_counts, new_total = histogram[("blog.view_category",)]
+    assert sum(new_counts) == before + 1
+    assert new_total > total
@@ -0,0 +1,68 @@
+import hashlib
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+
+# Schema and rows of a database created by the original db.create_all(), before the first migration
+BASELINE = """
+CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR(100) NOT NULL, password VARCHAR(100) NOT NULL,
+    email VARCHAR(250) NOT NULL, PRIMARY KEY (id), UNIQUE (email));
+CREATE TABLE blog_categories (id INTEGER NOT NULL, title VARCHAR(250) NOT NULL, subtitle VARCHAR(250) NOT NULL,
+    img_url VARCHAR(250) NOT NULL, author_id INTEGER NOT NULL, PRIMARY KEY (id), UNIQUE (title),
+    FOREIGN KEY(author_id) REFERENCES users (id));
+CREATE TABLE blog_posts (id INTEGER NOT NULL, title VARCHAR(250) NOT NULL, subtitle VARCHAR(250) NOT NULL,
+    body TEXT NOT NULL, img_url VARCHAR(250) NOT NULL, date VARCHAR(250) NOT NULL, author_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL, PRIMARY KEY (id), UNIQUE (title), FOREIGN KEY(author_id) REFERENCES users (id),
+    FOREIGN KEY(category_id) REFERENCES blog_categories (id));
+CREATE TABLE comments (id INTEGER NOT NULL, text TEXT NOT NULL, author_id INTEGER NOT NULL,
+    parent_post_id INTEGER NOT NULL, posted_time TEXT NOT NULL, PRIMARY KEY (id),
+    FOREIGN KEY(author_id) REFERENCES users (id), FOREIGN KEY(parent_post_id) REFERENCES blog_posts (id));
+INSERT INTO users VALUES (1, 'admin', 'pbkdf2:sha256:600000$abcdefgh$00', ' Admin@Example.com');
+INSERT INTO blog_categories VALUES (1, 'Python', 'Snakes', 'python.jpg', 1);
+INSERT INTO blog_posts VALUES (1, 'First', 'Hello', '<p style="text-align: center">Hi <script>x</script></p>',
+    'coding-bg.jpg', '24/06/2024', 1, 1);
+INSERT INTO comments VALUES (1, 'Nice <img src=x onerror=alert(1)>', 1, 1, '25/06/2024');
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blog.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_fresh_database_gets_every_migration_once(engine):
+    assert migrations.upgrade(engine) == migrations.available()
+    assert migrations.pending(engine) == []
+    assert migrations.upgrade(engine) == []
+    assert {"users", "blog_categories", "blog_posts", "comments", "post_search"} <= set(inspect(engine).get_table_names())
+
+    # Every foreign key column is indexed
+    inspector = inspect(engine)
+    for table in ("blog_categories", "blog_posts", "comments"):
+        indexed = {column for index in inspector.get_indexes(table) for column in index["column_names"]}
+        foreign_keys = {column for key in inspector.get_foreign_keys(table) for column in key["constrained_columns"]}
+        assert foreign_keys <= indexed, table
+
+
+def test_baseline_database_is_upgraded_with_its_rows(engine):
+    with engine.begin() as connection:
+        connection.connection.executescript(BASELINE)
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+        email_hash = connection.scalar(text("SELECT email_hash FROM users WHERE id = 1"))
+        assert email_hash == hashlib.md5(b"admin@example.com").hexdigest()
+        body, body_html, date = connection.execute(text("SELECT body, body_html, date FROM blog_posts")).one()
+        # The source is kept, the rendered copy drops the script and keeps the vetted style
+        assert "<script>" in body
+        assert body_html == '<p style="text-align: center">Hi </p>'
+        assert str(date).startswith("2024-06-24")
+        assert connection.scalar(text("SELECT text FROM comments")) == "Nice"
+        assert connection.scalar(text("SELECT comment_count FROM blog_posts")) == 1
+        assert connection.scalar(text("SELECT post_count FROM blog_categories")) == 1
+
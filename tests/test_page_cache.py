@@ -0,0 +1,93 @@
+from flask import Flask
+from flask_login import LoginManager
+
+from page_cache import PageCache
+
+
+def make_app(tags_url: str, cache: PageCache = None):
+    """A bare application whose /category/<id> view counts how often it is rendered."""
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", CACHE_TAGS_URL=tags_url)
+    LoginManager(app).user_loader(lambda user_id: None)
+    cache = cache or PageCache()
+    cache.init_app(app)
+    app.renders = 0
+
+    @app.route("/category/<int:id>")
+    @cache.cached(tags=lambda id: [f"category:{id}"])
+    def category(id):
+        app.renders += 1
+        return f"category {id}, render {app.renders}"
+
+    return app, cache
+
+
+def test_pages_are_served_until_a_tag_is_invalidated(tmp_path):
+    app, cache = make_app(f"sqlite:///{tmp_path / 'tags.db'}")
+    client = app.test_client()
+
+    assert client.get("/category/1").headers["X-Page-Cache"] == "MISS"
+    response = client.get("/category/1")
+    assert response.headers["X-Page-Cache"] == "HIT"
+    assert response.text == "category 1, render 1"
+
+    client.get("/category/2")
+    with app.app_context():
+        cache.invalidate("category:1")
+    assert client.get("/category/1").text == "category 1, render 3"
+    assert client.get("/category/2").headers["X-Page-Cache"] == "HIT"
+
+
+def test_clear_drops_every_page(tmp_path):
+    app, cache = make_app(f"sqlite:///{tmp_path / 'tags.db'}")
+    client = app.test_client()
+    client.get("/category/1")
+    client.get("/category/2")
+    with app.app_context():
+        cache.clear()
+    assert client.get("/category/1").headers["X-Page-Cache"] == "MISS"
+    assert client.get("/category/2").headers["X-Page-Cache"] == "MISS"
+
+
+def test_invalidation_reaches_the_memory_caches_of_other_workers(tmp_path):
+    # Two applications stand in for two gunicorn workers, each caching pages in its own memory
+    tags_url = f"sqlite:///{tmp_path / 'tags.db'}"
+    first, first_cache = make_app(tags_url)
+    second, _ = make_app(tags_url)
+    first_client, second_client = first.test_client(), second.test_client()
+    first_client.get("/category/1")
+    second_client.get("/category/1")
+    assert second_client.get("/category/1").headers["X-Page-Cache"] == "HIT"
+
+    with first.app_context():
+        first_cache.invalidate("category:1")
+    assert second_client.get("/category/1").headers["X-Page-Cache"] == "MISS"
+    assert second.renders == 2
+
+
+def test_one_extension_keeps_the_stores_of_each_application(tmp_path):
+    # Binding a second application must not take over the pages and tags of the first
+    cache = PageCache()
+    first, _ = make_app(f"sqlite:///{tmp_path / 'first.db'}", cache)
+    second, _ = make_app("memory", cache)
+    first_client, second_client = first.test_client(), second.test_client()
+    first_client.get("/category/1")
+    assert second_client.get("/category/1").headers["X-Page-Cache"] == "MISS"
+    assert first_client.get("/category/1").headers["X-Page-Cache"] == "HIT"
+
+    with second.app_context():
+        cache.invalidate("category:1")
+    assert first_client.get("/category/1").headers["X-Page-Cache"] == "HIT"
+
+
+def test_writes_invalidate_the_cached_pages(client, blog, log_in):
+    assert client.get("/category/1").headers["X-Page-Cache"] == "MISS"
+    assert client.get("/category/1").headers["X-Page-Cache"] == "HIT"
+
+    commenter = client.application.test_client()
+    log_in(commenter, blog["commenter"])
+    assert commenter.post("/api/category/1/post/1/comments", json={"body": "Nice"}).status_code == 201
+
+    response = client.get("/category/1")
+    assert response.headers["X-Page-Cache"] == "MISS"
+    assert b"1 comment" in response.data
@@ -0,0 +1,84 @@
+import pytest
+from flask import Flask
+
+from rate_limit import MemoryBackend, RateLimiter, SQLiteBackend, make_backend, parse_rate
+
+
+def make_app(url: str = "memory"):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", RATE_LIMIT_URL=url)
+    limiter = RateLimiter(app)
+
+    @app.route("/contact", methods=["GET", "POST"])
+    @limiter.limit("contact", "2/minute")
+    def contact():
+        return "sent"
+
+    return app, limiter
+
+
+@pytest.mark.parametrize("rate, expected", [("5/minute", (5, 5 / 60)), ("3/hour", (3, 3 / 3600)),
+                                            ("20/300", (20, 20 / 300))])
+def test_parse_rate(rate, expected):
+    assert parse_rate(rate) == expected
+
+
+def test_requests_beyond_the_limit_get_429_with_retry_after():
+    app, limiter = make_app()
+    client = app.test_client()
+    assert [client.post("/contact").status_code for _ in range(2)] == [200, 200]
+
+    response = client.post("/contact")
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 30
+    assert limiter.rejected == 1
+    # Only the methods that take a token are limited
+    assert client.get("/contact").status_code == 200
+
+
+def test_clients_have_buckets_of_their_own():
+    app, _ = make_app()
+    client = app.test_client()
+    for _ in range(3):
+        client.post("/contact", environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert client.post("/contact", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+
+
+def test_limits_are_overridden_by_the_configuration():
+    app, _ = make_app()
+    app.config["RATE_LIMIT_CONTACT"] = "1/minute"
+    client = app.test_client()
+    assert [client.post("/contact").status_code for _ in range(2)] == [200, 429]
+
+
+def test_disabled_limiter_lets_every_request_through():
+    app, _ = make_app()
+    app.config["RATE_LIMIT_ENABLED"] = False
+    client = app.test_client()
+    assert {client.post("/contact").status_code for _ in range(5)} == {200}
+
+
+def test_buckets_refill_over_time(monkeypatch):
+    backend = MemoryBackend()
+    now = [1000.0]
+    monkeypatch.setattr("rate_limit.time.time", lambda: now[0])
+    assert backend.take(["key"], 1, 1 / 60) == 0
+    assert backend.take(["key"], 1, 1 / 60) == pytest.approx(60)
+    now[0] += 60
+    assert backend.take(["key"], 1, 1 / 60) == 0
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'limits.db'}"
+    first, second = make_backend(url, 100), make_backend(url, 100)
+    assert isinstance(first, SQLiteBackend)
+    assert first.take(["key"], 2, 2 / 60) == 0
+    assert second.take(["key"], 2, 2 / 60) == 0
+    assert first.take(["key"], 2, 2 / 60) > 0
+
+
+def test_blog_login_is_rate_limited(client, blog):
+    statuses = [client.post("/login", data={"email": "eva@example.com", "password": "wrong"}).status_code
+                for _ in range(11)]
+    assert statuses[:10] == [200] * 10
+    assert statuses[10] == 429
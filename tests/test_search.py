@@ -0,0 +1,56 @@
+from sqlalchemy import text
+
+import main
+
+
+def search(client, query: str) -> list:
+    with client.application.app_context():
+        results, total = main.search_index.search(main.db.session, query)
+    assert total == len(results)
+    return [(result["id"], str(result["snippet"])) for result in results]
+
+
+def comment_document_count(app) -> int:
+    with app.app_context():
+        return main.db.session.execute(text("SELECT count(*) FROM comment_search")).scalar()
+
+
+def test_posts_are_found_by_their_own_text(client, blog):
+    assert search(client, "world") == [(1, "Hello <mark>world</mark>")]
+    assert search(client, "nothing") == []
+
+
+def test_comments_are_indexed_without_rewriting_the_post(client, blog, log_in):
+    with client.application.app_context():
+        before = main.db.session.execute(text("SELECT rowid, title, body FROM post_search")).all()
+
+    log_in(client, blog["commenter"])
+    client.post("/api/category/1/post/1/comments", json={"body": "Lovely <b>pythons</b>"})
+    assert comment_document_count(client.application) == 1
+    assert search(client, "python") == [(1, "Lovely <mark>pythons</mark>")]
+    with client.application.app_context():
+        assert main.db.session.execute(text("SELECT rowid, title, body FROM post_search")).all() == before
+
+
+def test_deleted_comments_leave_the_index(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    client.post("/api/category/1/post/1/comments", json={"body": "Lovely pythons"})
+    client.get("/category/1/post/1/delete-comment/1")
+    assert comment_document_count(client.application) == 0
+    assert search(client, "python") == []
+
+
+def test_a_post_matching_in_several_documents_is_listed_once(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    client.post("/api/category/1/post/1/comments", json={"body": "Hello again"})
+    client.post("/api/category/1/post/1/comments", json={"body": "Hello from me too"})
+    assert [id for id, snippet in search(client, "hello")] == [1]
+
+
+def test_rebuild_indexes_posts_and_comments(app, blog):
+    with app.app_context():
+        main.db.session.add(main.Comment(text="Snakes are great", author_id=2, parent_post_id=1))
+        main.db.session.commit()
+        assert main.search_index.rebuild(main.db.session) == 1
+        main.db.session.commit()
+    assert comment_document_count(app) == 1
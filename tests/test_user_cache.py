@@ -0,0 +1,73 @@
+from flask import Flask
+
+import main
+from user_cache import UserCache, UserSnapshot
+
+
+def make_app(tags_url: str) -> Flask:
+    app = Flask(__name__)
+    app.config["CACHE_TAGS_URL"] = tags_url
+    return app
+
+
+def counting_loader(loads: list):
+    def loader():
+        loads.append(1)
+        return UserSnapshot(id=1, username=f"eva{len(loads)}", email="eva@example.com")
+    return loader
+
+
+def test_users_are_loaded_once_until_invalidated(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'tags.db'}")
+    cache = UserCache(app=app)
+    loader = counting_loader([])
+
+    with app.app_context():
+        assert cache.load(1, loader).username == "eva1"
+        assert cache.load("1", loader).username == "eva1"
+        cache.invalidate(1)
+        assert cache.load(1, loader).username == "eva2"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_invalidation_reaches_the_other_workers(tmp_path):
+    tags_url = f"sqlite:///{tmp_path / 'tags.db'}"
+    first, second = make_app(tags_url), make_app(tags_url)
+    cache = UserCache()
+    cache.init_app(first)
+    cache.init_app(second)
+    loads = []
+    with first.app_context():
+        cache.load(1, counting_loader(loads))
+    with second.app_context():
+        cache.load(1, counting_loader(loads))
+
+    with first.app_context():
+        cache.invalidate(1)
+    with second.app_context():
+        assert cache.load(1, counting_loader(loads)).username == "eva3"
+
+
+def test_applications_keep_their_own_users(tmp_path):
+    cache = UserCache()
+    first, second = make_app("memory"), make_app("memory")
+    cache.init_app(first)
+    cache.init_app(second)
+    loads = []
+    with first.app_context():
+        cache.load(1, counting_loader(loads))
+    # Binding the second application left the first one's users in place
+    with second.app_context():
+        assert cache.load(1, counting_loader(loads)).username == "eva2"
+    with first.app_context():
+        assert cache.load(1, counting_loader(loads)).username == "eva1"
+
+
+def test_logged_in_users_are_not_queried_per_request(client, blog, log_in):
+    log_in(client, blog["commenter"])
+    cache = main.user_cache
+    client.get("/about")
+    misses = cache.misses
+    client.get("/about")
+    client.get("/category/1")
+    assert cache.misses == misses
@@ -0,0 +1,119 @@
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from web_email import Mailer, Outbox, build_message
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of an SMTP server for smtplib, every message is appended to server.messages."""
+
+    def handle(self):
+        self.reply("220 localhost ready")
+        lines = None
+        for line in self.rfile:
+            if lines is not None:
+                if line == b".\r\n":
+                    self.server.messages.append(b"".join(lines))
+                    lines = None
+                    self.reply("250 queued")
+                else:
+                    lines.append(line)
+                continue
+            command = line[:4].upper()
+            if command == b"DATA":
+                lines = []
+                self.reply("354 end with .")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox.sqlite3"))
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_started_mailer_delivers_queued_messages(smtp_server, outbox):
+    # Queued before the thread runs, e.g. by a worker that was restarted
+    outbox.add(build_message("Jan", "jan@example.com", "123", "Hello"))
+    mailer = Mailer(outbox, host="127.0.0.1", port=smtp_server.server_address[1], starttls=False,
+                    user="blog@example.com", password=None, poll_interval=0.1)
+    mailer.start()
+    try:
+        wait_for(lambda: outbox.pending() == 0)
+        outbox.add(build_message("Eva", "eva@example.com", "456", "Hi"))
+        mailer.notify()
+        wait_for(lambda: len(smtp_server.messages) == 2)
+    finally:
+        mailer.stop()
+    assert b"Subject: Received message from Jan" in smtp_server.messages[0]
+    assert b"Email address: eva@example.com" in smtp_server.messages[1]
+
+
+def test_failed_delivery_is_logged_and_retried(outbox, caplog):
+    message_id = outbox.add(build_message("Jan", "jan@example.com", "123", "Hello"))
+    mailer = Mailer(outbox, host="127.0.0.1", port=unused_port(), starttls=False,
+                    user="blog@example.com", password=None)
+    with caplog.at_level("WARNING", logger="web_email"):
+        assert mailer.deliver_pending() == 0
+    assert "Cannot connect" in caplog.text
+    attempts, status = outbox._connection().execute(
+        "SELECT attempts, status FROM outbox WHERE id = ?", (message_id,)).fetchone()
+    assert (attempts, status) == (1, "pending")
+
+
+def test_unexpected_errors_do_not_stop_the_thread(smtp_server, outbox, caplog, monkeypatch):
+    mailer = Mailer(outbox, host="127.0.0.1", port=smtp_server.server_address[1], starttls=False,
+                    user="blog@example.com", password=None, poll_interval=0.1)
+    claim = outbox.claim
+    calls = []
+
+    def failing_claim(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return claim(*args, **kwargs)
+
+    monkeypatch.setattr(outbox, "claim", failing_claim)
+    outbox.add(build_message("Jan", "jan@example.com", "123", "Hello"))
+    with caplog.at_level("ERROR", logger="web_email"):
+        mailer.start()
+        try:
+            wait_for(lambda: smtp_server.messages)
+        finally:
+            mailer.stop()
+    assert "Email delivery failed" in caplog.text
@@ -0,0 +1,87 @@
+"""
+Process-local cache of logged in users, so the user loader does not query the
+users table on every request. Entries expire after USER_CACHE_TTL seconds and are
+invalidated whenever the user row changes, through a "user:<id>" tag in the tag
+version store of the page cache (CACHE_TAGS_URL), so a change handled by one
+worker reaches the cached copies of all others.
+"""
+from collections import namedtuple
+
+from flask import current_app
+from flask_login import UserMixin
+
+from page_cache import MemoryBackend, make_tags, tags_url
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the User columns needed while rendering pages."""
+
+    def __init__(self, id: int, username: str, email: str, email_hash: str = None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.email_hash = email_hash
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username, email=user.email, email_hash=user.email_hash)
+
+
+# Users cached for one application, kept in app.extensions["user_cache"]
+UserCacheState = namedtuple("UserCacheState", "backend tags ttl")
+
+
+class UserCache():
+    """LRU of UserSnapshot objects with TTL, per application, and hit rate counters of the process."""
+
+    def __init__(self, ttl: int = 300, max_entries: int = 1024, app=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Applies USER_CACHE_TTL and USER_CACHE_MAX_ENTRIES, starting with an empty cache."""
+        app.extensions["user_cache"] = UserCacheState(
+            backend=MemoryBackend(max_entries=app.config.setdefault("USER_CACHE_MAX_ENTRIES", self.max_entries)),
+            tags=make_tags(tags_url(app)),
+            ttl=app.config.setdefault("USER_CACHE_TTL", self.ttl))
+
+    @staticmethod
+    def state() -> UserCacheState:
+        return current_app.extensions["user_cache"]
+
+    def load(self, user_id, loader) -> UserSnapshot:
+        """
+        Returns the cached user, or the one built by loader() which is then cached.
+        The version is read before loading, so a change made meanwhile is not hidden by the new entry.
+        Args: user_id (int): The ID of the user.
+              loader (callable): Builds the UserSnapshot from the database.
+        """
+        user_id = int(user_id)
+        state = self.state()
+        version = state.tags.tag_versions((f"user:{user_id}",))[0]
+        entry = state.backend.get(user_id)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        snapshot = loader()
+        state.backend.set(user_id, (version, snapshot), state.ttl)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Drops the user from the cache of every worker sharing the tag store."""
+        state = self.state()
+        state.tags.bump((f"user:{int(user_id)}",))
+        state.backend.delete(int(user_id))
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
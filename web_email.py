@@ -1,21 +1,242 @@
+import logging
 import smtplib
+import sqlite3
+import threading
+import time
 import os
 
-PORT = 587
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
 MY_EMAIL = os.environ.get("MY_EMAIL")
 MY_PASSWORD = os.environ.get("MY_PASSWORD")
 
+OUTBOX_PATH = os.environ.get("EMAIL_OUTBOX", "outbox.sqlite3")
+BATCH_SIZE = 20           # messages delivered over one connection per round
+MAX_ATTEMPTS = 6          # after that a message is marked as failed
+RETRY_DELAY = 5           # seconds, doubled after every failed attempt
+CLAIM_LEASE = 120         # seconds a claimed message is hidden from other workers
+IDLE_TIMEOUT = 60         # seconds an unused SMTP connection is kept open
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(name: str, email: str, phone_number: str, message: str) -> bytes:
+    return (f"Subject: Received message from {name}\n\nThe message:\n\n{message}\n\n"
+            f"Contact info:\nEmail address: {email}\nPhone number: {phone_number}").encode("utf-8")
+
+
+class Outbox():
+    """
+    Messages waiting for delivery, persisted in a local SQLite file so nothing is
+    lost when a worker restarts. Every gunicorn worker on the host shares the file.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        if not self._ready:
+            connection.execute("CREATE TABLE IF NOT EXISTS outbox ("
+                               "id INTEGER PRIMARY KEY, message BLOB NOT NULL, "
+                               "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                               "next_attempt REAL NOT NULL, last_error TEXT, created REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_outbox_pending ON outbox (status, next_attempt)")
+            self._ready = True
+        return connection
+
+    def add(self, message: bytes) -> int:
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO outbox (message, next_attempt, created) VALUES (?, ?, ?)", (message, now, now))
+        return cursor.lastrowid
+
+    def claim(self, limit: int = BATCH_SIZE) -> list:
+        """
+        Takes up to `limit` due messages and leases them to the caller.
+        Returns: list: (id, message, attempts) tuples.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT id, message, attempts FROM outbox "
+                                      "WHERE status = 'pending' AND next_attempt <= ? "
+                                      "ORDER BY next_attempt LIMIT ?", (now, limit)).fetchall()
+            connection.executemany("UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                                   [(now + CLAIM_LEASE, row[0]) for row in rows])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return rows
+
+    def delivered(self, message_id: int):
+        self._connection().execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    def retry(self, message_id: int, attempts: int, error: str):
+        """Schedules another attempt with exponential backoff, or gives up after MAX_ATTEMPTS."""
+        attempts += 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up on message %d after %d attempts: %s", message_id, attempts, error)
+            self._connection().execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? "
+                                       "WHERE id = ?", (attempts, error, message_id))
+        else:
+            self._connection().execute("UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? "
+                                       "WHERE id = ?",
+                                       (attempts, time.time() + RETRY_DELAY * 2 ** (attempts - 1), error, message_id))
+
+    def release(self, message_ids: list):
+        """Hands claimed messages back without counting an attempt."""
+        self._connection().executemany("UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                                       [(time.time(), message_id) for message_id in message_ids])
+
+    def pending(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+class Mailer():
+    """
+    Delivers the outbox from a background thread over one reused, authenticated
+    SMTP connection. gunicorn's post_worker_init hook starts the thread, so it runs
+    in every worker and delivers the messages queued before a restart; notify()
+    starts it on demand elsewhere, and start() begins again in a process forked
+    from one whose thread was already running.
+    """
+
+    def __init__(self, outbox: Outbox, host: str = SMTP_HOST, port: int = PORT, starttls: bool = SMTP_STARTTLS,
+                 user: str = MY_EMAIL, password: str = MY_PASSWORD, poll_interval: float = 5):
+        self.outbox = outbox
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.poll_interval = poll_interval
+        self._smtp = None
+        self._last_used = 0
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="mailer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    def notify(self):
+        """Wakes the delivery thread up after a message was queued."""
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.deliver_pending()
+            except Exception:
+                # The outbox keeps the messages, the next round tries them again
+                logger.exception("Email delivery failed")
+                delivered = 0
+            if delivered:
+                continue
+            if self._smtp is not None and time.time() - self._last_used > IDLE_TIMEOUT:
+                self._close()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except (smtplib.SMTPException, OSError):
+                self._close()
+        connection = smtplib.SMTP(host=self.host, port=self.port, timeout=30)
+        if self.starttls:
+            connection.starttls()
+        if self.password:
+            connection.login(user=self.user, password=self.password)
+        self._smtp = connection
+        return connection
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def deliver_pending(self) -> int:
+        """
+        Sends one batch of due messages over the shared connection.
+        Returns: int: Number of messages delivered.
+        """
+        batch = self.outbox.claim()
+        if not batch:
+            return 0
+        delivered = 0
+        try:
+            connection = self._connection()
+        except (smtplib.SMTPException, OSError) as error:
+            logger.warning("Cannot connect to %s:%s: %r", self.host, self.port, error)
+            for message_id, _, attempts in batch:
+                self.outbox.retry(message_id, attempts, repr(error))
+            return 0
+        for position, (message_id, message, attempts) in enumerate(batch):
+            try:
+                connection.sendmail(from_addr=self.user, to_addrs=self.user, msg=message)
+            except (smtplib.SMTPServerDisconnected, OSError) as error:
+                # The connection is gone, the rest of the batch waits for the next round
+                logger.warning("SMTP connection lost while sending message %d: %r", message_id, error)
+                self._smtp = None
+                self.outbox.retry(message_id, attempts, repr(error))
+                self.outbox.release([row[0] for row in batch[position + 1:]])
+                break
+            except smtplib.SMTPException as error:
+                logger.warning("Message %d was rejected: %r", message_id, error)
+                self.outbox.retry(message_id, attempts, repr(error))
+            else:
+                self.outbox.delivered(message_id)
+                delivered += 1
+        self._last_used = time.time()
+        return delivered
+
+
+outbox = Outbox()
+mailer = Mailer(outbox)
+
+
 def send_email(name: str, email: str, phone_number:str, message: str):
+    """
+    Queues a contact form message, delivery happens in the background.
+    Returns: bool: True when the message was accepted into the outbox.
+    """
     if not email:
         return False
     try:
-        with smtplib.SMTP(host="smtp.gmail.com", port=PORT) as connection:
-            connection.starttls()
-            connection.login(user=MY_EMAIL, password=MY_PASSWORD)
-            connection.sendmail(
-                from_addr=MY_EMAIL,
-                to_addrs=MY_EMAIL,
-                msg=(f"Subject: Received message from {name}\n\nThe message:\n\n{message}\n\nContact info:\nEmail address: {email}\nPhone number: {phone_number}").encode("utf-8"))
-        return True
+        outbox.add(build_message(name=name, email=email, phone_number=phone_number, message=message))
     except(UnicodeEncodeError):
-        return False
\ No newline at end of file
+        return False
+    mailer.notify()
+    return True